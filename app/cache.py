@@ -0,0 +1,159 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+
+DEFAULT_CACHE_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), ".cache")
+
+
+class CacheEntry:
+    __slots__ = ("value", "stored_at")
+
+    def __init__(self, value, stored_at):
+        self.value = value
+        self.stored_at = stored_at
+
+    @property
+    def age(self):
+        return time.time() - self.stored_at
+
+
+class TieredCache:
+    """
+    Two-level cache: an in-memory LRU in front of an optional SQLite table.
+
+    Values must be JSON serialisable. The SQLite tier runs in WAL mode so several
+    worker processes can share one database file. Entries older than `ttl` seconds
+    are treated as expired by `get`, but stay readable through `get_entry` so callers
+    can revalidate them; the disk tier drops rows older than `max_age` (default: `ttl`).
+    """
+
+    def __init__(self, name, max_entries=256, ttl=None, db_path=None, max_db_entries=None, max_age=None):
+        self.name = name
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.max_age = max_age if max_age is not None else ttl
+        self.db_path = db_path
+        self.max_db_entries = max_db_entries
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+        self._db = None
+        self._writes_since_prune = 0
+        self.counters = {"memory_hits": 0, "disk_hits": 0, "misses": 0, "expired": 0, "sets": 0, "evictions": 0}
+        if db_path:
+            self._open_db()
+
+    def _open_db(self):
+        os.makedirs(os.path.dirname(os.path.abspath(self.db_path)), exist_ok=True)
+        self._db = sqlite3.connect(self.db_path, timeout=30, check_same_thread=False, isolation_level=None)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.execute(
+            f'CREATE TABLE IF NOT EXISTS "{self.name}" (key TEXT PRIMARY KEY, value TEXT NOT NULL, stored_at REAL NOT NULL)'
+        )
+        self._db.execute(f'CREATE INDEX IF NOT EXISTS "{self.name}_stored_at" ON "{self.name}" (stored_at)')
+
+    def _remember(self, key, entry):
+        self._memory[key] = entry
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_entries:
+            self._memory.popitem(last=False)
+            self.counters["evictions"] += 1
+
+    def is_fresh(self, entry):
+        return self.ttl is None or entry.age <= self.ttl
+
+    def get_entry(self, key):
+        """Return the CacheEntry for key regardless of age, or None"""
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None:
+                self._memory.move_to_end(key)
+                self.counters["memory_hits"] += 1
+                return entry
+            if self._db is not None:
+                row = self._db.execute(
+                    f'SELECT value, stored_at FROM "{self.name}" WHERE key = ?', (key,)
+                ).fetchone()
+                if row is not None:
+                    entry = CacheEntry(json.loads(row[0]), row[1])
+                    self._remember(key, entry)
+                    self.counters["disk_hits"] += 1
+                    return entry
+            self.counters["misses"] += 1
+            return None
+
+    def get(self, key):
+        """Return the cached value for key, or None if missing or expired"""
+        entry = self.get_entry(key)
+        if entry is None:
+            return None
+        if not self.is_fresh(entry):
+            with self._lock:
+                self.counters["expired"] += 1
+            return None
+        return entry.value
+
+    def set(self, key, value, stored_at=None):
+        entry = CacheEntry(value, stored_at if stored_at is not None else time.time())
+        with self._lock:
+            self._remember(key, entry)
+            self.counters["sets"] += 1
+            if self._db is not None:
+                self._db.execute(
+                    f'INSERT OR REPLACE INTO "{self.name}" (key, value, stored_at) VALUES (?, ?, ?)',
+                    (key, json.dumps(value), entry.stored_at)
+                )
+                self._writes_since_prune += 1
+                if self._writes_since_prune >= 100:
+                    self._prune_db()
+
+    def touch(self, key):
+        """Reset an entry's age after it was successfully revalidated"""
+        now = time.time()
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None:
+                entry.stored_at = now
+            if self._db is not None:
+                self._db.execute(f'UPDATE "{self.name}" SET stored_at = ? WHERE key = ?', (now, key))
+
+    def _prune_db(self):
+        self._writes_since_prune = 0
+        if self.max_age is not None:
+            self._db.execute(f'DELETE FROM "{self.name}" WHERE stored_at < ?', (time.time() - self.max_age,))
+        if self.max_db_entries:
+            self._db.execute(
+                f'DELETE FROM "{self.name}" WHERE key IN '
+                f'(SELECT key FROM "{self.name}" ORDER BY stored_at DESC LIMIT -1 OFFSET ?)',
+                (self.max_db_entries,)
+            )
+
+    def clear(self):
+        with self._lock:
+            self._memory.clear()
+            if self._db is not None:
+                self._db.execute(f'DELETE FROM "{self.name}"')
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self.counters)
+            stats["memory_entries"] = len(self._memory)
+        stats["hits"] = stats["memory_hits"] + stats["disk_hits"]
+        return stats
+
+
+def cache_from_env(name, prefix, ttl, max_entries=256, max_db_entries=None):
+    """Build a TieredCache configured through <PREFIX>_TTL, _SIZE, _DB and _MAX_ROWS"""
+    db_path = os.getenv(f"{prefix}_DB", os.path.join(DEFAULT_CACHE_DIR, f"{name}.sqlite3"))
+    max_rows = os.getenv(f"{prefix}_MAX_ROWS")
+    return TieredCache(
+        name,
+        max_entries=int(os.getenv(f"{prefix}_SIZE", str(max_entries))),
+        ttl=float(os.getenv(f"{prefix}_TTL", str(ttl))),
+        db_path=db_path or None,
+        max_db_entries=int(max_rows) if max_rows else max_db_entries,
+    )
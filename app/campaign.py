@@ -0,0 +1,245 @@
+"""
+Bulk cold email campaigns from the command line.
+
+Reads job URLs from a CSV file (job_url column), a JSONL file ({"job_url": ...}
+per line) or a text file (one URL per line) and appends one JSON line per input
+row to the output as soon as that row is done:
+
+    python app/campaign.py jobs.csv --output emails.jsonl --your-name "Jane Doe" --your-email jane@example.com
+
+Rows may carry their own your_name, your_email and recipient_name; the options
+are the defaults. Progress is checkpointed next to the output, so running the
+same command again after a crash or Ctrl-C picks up where it stopped.
+"""
+import argparse
+import asyncio
+import csv
+import json
+import os
+import sys
+import time
+
+# Add parent directory to path for imports
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.pipeline import ConcurrencyLimiter, generate_email_for_url
+
+CANDIDATE_FIELDS = ("your_name", "your_email", "recipient_name")
+
+
+def read_rows(path):
+    """Input rows as dicts, streamed from the file one at a time"""
+    if path.endswith((".jsonl", ".ndjson")):
+        with open(path, encoding="utf-8") as f:
+            for line in f:
+                if line.strip():
+                    yield json.loads(line)
+    elif path.endswith(".csv"):
+        with open(path, newline="", encoding="utf-8-sig") as f:
+            yield from csv.DictReader(f)
+    else:
+        with open(path, encoding="utf-8") as f:
+            for line in f:
+                url = line.strip()
+                if url and not url.startswith("#"):
+                    yield {"job_url": url}
+
+
+class Checkpoint:
+    """
+    Low watermark over finished input rows: every row before `watermark` is in
+    the output. Rows finished out of order wait in `pending` until the rows
+    before them are done, so only the in-flight window is ever held in memory.
+    """
+
+    def __init__(self, path, source, watermark=0, save_interval=2.0):
+        self.path = path
+        self.source = source
+        self.watermark = watermark
+        self.pending = set()
+        self.save_interval = save_interval
+        self._saved_at = 0.0
+
+    @classmethod
+    def load(cls, path, source):
+        if not os.path.exists(path):
+            return cls(path, source)
+        with open(path) as f:
+            state = json.load(f)
+        if state["source"] != source:
+            raise SystemExit(f"{path} belongs to a run over {state['source']}; use --restart to start over")
+        return cls(path, source, watermark=state["watermark"])
+
+    def done(self, index):
+        if index < self.watermark:
+            return
+        self.pending.add(index)
+        while self.watermark in self.pending:
+            self.pending.remove(self.watermark)
+            self.watermark += 1
+
+    def skip(self, index):
+        return index < self.watermark or index in self.pending
+
+    def due(self):
+        return time.monotonic() - self._saved_at >= self.save_interval
+
+    def save(self):
+        self._saved_at = time.monotonic()
+        tmp = f"{self.path}.tmp"
+        with open(tmp, "w") as f:
+            json.dump({"source": self.source, "watermark": self.watermark}, f)
+        os.replace(tmp, self.path)
+
+
+def recover_output(path, checkpoint):
+    """
+    Mark rows already in the output as done (rows past the watermark finish out
+    of order) and cut off a line left half written by a crash.
+    """
+    if not os.path.exists(path):
+        return
+    complete = 0
+    with open(path, "rb") as f:
+        for line in f:
+            if not line.endswith(b"\n"):
+                break
+            complete += len(line)
+            checkpoint.done(json.loads(line)["index"])
+    if complete < os.path.getsize(path):
+        with open(path, "rb+") as f:
+            f.truncate(complete)
+
+
+async def run_campaign(rows, output_path, chain, portfolio, defaults=None, checkpoint=None,
+                       concurrency=16, llm_concurrency=8, timeout=300.0, progress=None):
+    """
+    Generate an email for every row of `rows` (an iterable of dicts with job_url)
+    and append the results to output_path as JSON lines, in completion order.
+
+    Up to `concurrency` rows are in flight; scrapes are additionally capped
+    globally and per host and LLM calls by llm_concurrency, so pages are fetched
+    while earlier ones are still being written. Returns counts per status.
+    """
+    defaults = defaults or {}
+    scrape_limiter = ConcurrencyLimiter(
+        max_concurrency=int(os.getenv("SCRAPE_MAX_CONCURRENCY", "20")),
+        per_host=int(os.getenv("SCRAPE_PER_HOST_CONCURRENCY", "4"))
+    )
+    llm_slots = asyncio.Semaphore(llm_concurrency)
+    # Bounded, so the reader never runs more than a few rows ahead of the workers
+    queue = asyncio.Queue(maxsize=concurrency * 2)
+    counts = {"ok": 0, "skipped": 0, "error": 0}
+
+    async def process(index, row):
+        fields = {name: row.get(name) or defaults.get(name, "") for name in CANDIDATE_FIELDS}
+        record = {"index": index, "job_url": row.get("job_url") or row.get("url") or "", **fields}
+        started = time.perf_counter()
+        try:
+            if not record["job_url"]:
+                raise ValueError("Row has no job_url")
+            email = await asyncio.wait_for(
+                generate_email_for_url(
+                    chain, portfolio, record["job_url"], **fields,
+                    scrape_limiter=scrape_limiter, llm_slots=llm_slots
+                ),
+                timeout
+            )
+        except Exception as e:
+            record.update(status="error", error=str(e) or type(e).__name__)
+        else:
+            if email is None:
+                record.update(status="skipped", reason="No usable text or job postings on the page")
+            else:
+                record.update(status="ok", email=email)
+        record["seconds"] = round(time.perf_counter() - started, 3)
+        return record
+
+    async def produce():
+        for index, row in enumerate(rows):
+            if checkpoint is None or not checkpoint.skip(index):
+                await queue.put((index, row))
+        for _ in range(concurrency):
+            await queue.put(None)
+
+    with open(output_path, "a", encoding="utf-8") as out:
+        def flush_checkpoint():
+            if checkpoint is not None:
+                # Results must be on disk before the watermark that covers them
+                out.flush()
+                os.fsync(out.fileno())
+                checkpoint.save()
+
+        async def work():
+            while (item := await queue.get()) is not None:
+                record = await process(*item)
+                out.write(json.dumps(record) + "\n")
+                counts[record["status"]] += 1
+                if checkpoint is not None:
+                    checkpoint.done(record["index"])
+                    if checkpoint.due():
+                        flush_checkpoint()
+                if progress:
+                    progress(counts)
+
+        try:
+            await asyncio.gather(produce(), *(work() for _ in range(concurrency)))
+        finally:
+            flush_checkpoint()
+    return counts
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Generate cold emails for a file of job URLs")
+    parser.add_argument("input", help="CSV (job_url column), JSONL or text file of job URLs")
+    parser.add_argument("--output", "-o", required=True, help="JSONL file results are appended to")
+    parser.add_argument("--your-name", default="")
+    parser.add_argument("--your-email", default="")
+    parser.add_argument("--recipient-name", default="")
+    parser.add_argument("--concurrency", type=int, default=16, help="rows in flight (default 16)")
+    parser.add_argument("--llm-concurrency", type=int, default=int(os.getenv("LLM_MAX_CONCURRENCY", "8")))
+    parser.add_argument("--timeout", type=float, default=300.0, help="seconds allowed per row")
+    parser.add_argument("--restart", action="store_true", help="discard the output and checkpoint and start over")
+    args = parser.parse_args(argv)
+
+    from app.chains import Chain
+    from app.portfolio import Portfolio
+
+    checkpoint_path = f"{args.output}.checkpoint"
+    if args.restart:
+        for path in (args.output, checkpoint_path):
+            if os.path.exists(path):
+                os.remove(path)
+    checkpoint = Checkpoint.load(checkpoint_path, os.path.abspath(args.input))
+    recover_output(args.output, checkpoint)
+    if checkpoint.watermark or checkpoint.pending:
+        print(f"Resuming: {checkpoint.watermark + len(checkpoint.pending)} rows already done", file=sys.stderr)
+
+    portfolio = Portfolio()
+    portfolio.load_portfolio()
+    defaults = {"your_name": args.your_name, "your_email": args.your_email, "recipient_name": args.recipient_name}
+    started = time.monotonic()
+
+    def progress(counts):
+        total = sum(counts.values())
+        if total % 50 == 0:
+            rate = total / max(time.monotonic() - started, 1e-9)
+            print(f"{total} rows ({counts['ok']} ok, {counts['skipped']} skipped, {counts['error']} errors), "
+                  f"{rate:.1f} rows/s", file=sys.stderr)
+
+    try:
+        counts = asyncio.run(run_campaign(
+            read_rows(args.input), args.output, Chain(), portfolio, defaults=defaults, checkpoint=checkpoint,
+            concurrency=args.concurrency, llm_concurrency=args.llm_concurrency, timeout=args.timeout,
+            progress=progress
+        ))
+    except KeyboardInterrupt:
+        print("Interrupted; run the same command again to resume", file=sys.stderr)
+        return 130
+    print(f"Done: {counts['ok']} ok, {counts['skipped']} skipped, {counts['error']} errors -> {args.output}",
+          file=sys.stderr)
+    return 1 if counts["error"] and not counts["ok"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,38 +1,204 @@
 import os
-from langchain_groq import ChatGroq
+import re
+import copy
+import time
+import asyncio
+import contextlib
+import hashlib
+import threading
 from langchain_core.prompts import PromptTemplate
 from langchain_core.output_parsers import JsonOutputParser
 from langchain_core.exceptions import OutputParserException
 from dotenv import load_dotenv
+from app.cache import cache_from_env
+from app.llm_pool import groq_pool_from_env, note_models, track_models
+from app.metrics import record_tokens
+from app.relevance import merge_jobs, select_relevant_text, split_for_extraction
+from app.singleflight import SingleFlight
 
 load_dotenv()
 
+MODEL_NAME = "llama-3.3-70b-versatile"
+
+PROMPTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "prompts")
+
+# Stateless, so one instance serves every request
+JSON_PARSER = JsonOutputParser()
+
+# Stand-ins for the candidate fields while a reusable email template is written
+MAIL_PLACEHOLDERS = {"greeting": "__GREETING__", "your_name": "__YOUR_NAME__", "your_email": "__YOUR_EMAIL__"}
+PLACEHOLDER_PATTERN = re.compile(r"__[A-Z][A-Z_]*__")
+
+
+class PromptFile:
+    """
+    A prompt template kept in PROMPTS_DIR.
+
+    The parsed PromptTemplate is reused until the file changes on disk; edits
+    are picked up within check_interval seconds without a restart (0 turns the
+    check off, so the file is read once).
+    """
+
+    def __init__(self, name, prompts_dir=None, check_interval=None):
+        self.path = os.path.join(prompts_dir or PROMPTS_DIR, name)
+        if check_interval is None:
+            check_interval = float(os.getenv("PROMPT_RELOAD_INTERVAL", "2"))
+        self.check_interval = check_interval
+        self._lock = threading.Lock()
+        self._stamp = None
+        self._checked = 0.0
+        self.template = None
+        self.reload()
+
+    def reload(self):
+        with self._lock:
+            stat = os.stat(self.path)
+            stamp = (stat.st_mtime_ns, stat.st_size)
+            self._checked = time.monotonic()
+            if stamp == self._stamp:
+                return False
+            with open(self.path, encoding="utf-8") as f:
+                text = f.read()
+            self.template = PromptTemplate.from_template(text)
+            self._stamp = stamp
+            return True
+
+    def current(self):
+        """The up-to-date PromptTemplate (the same object while the file is unchanged)"""
+        if self.check_interval and time.monotonic() - self._checked >= self.check_interval:
+            try:
+                self.reload()
+            except OSError:
+                # Keep serving the last good template while the file is being replaced
+                pass
+        return self.template
+
+
 class Chain:
-    def __init__(self):
-        self.llm = ChatGroq(temperature=0, groq_api_key=os.getenv("GROQ_API_KEY"), model_name="llama-3.3-70b-versatile")
+    def __init__(self, extraction_cache=None, token_budget=None, llm=None, fused=None, mail_template_cache=None):
+        self.model_name = MODEL_NAME
+        # EMAIL_MODE=fused: one LLM call extracts the first job and writes its email
+        self.fused = fused if fused is not None else os.getenv("EMAIL_MODE", "").lower() == "fused"
+        # Page text sent to extract_jobs is cut to this many (estimated) tokens
+        self.token_budget = token_budget or int(os.getenv("EXTRACT_TOKEN_BUDGET", "4000"))
+        # Groq calls are spread over every configured key (and a fallback model);
+        # any LangChain chat model can be passed instead (e.g. the benchmark fake)
+        self.llm = llm or groq_pool_from_env(self.model_name)
+        # Parsed extract_jobs results, shared across workers through SQLite.
+        # Pass extraction_cache=False to disable it.
+        if extraction_cache is None:
+            extraction_cache = cache_from_env("extraction_cache", "EXTRACTION_CACHE", ttl=7 * 24 * 3600,
+                                              max_entries=512, max_db_entries=20000)
+        self.extraction_cache = extraction_cache or None
+        # EMAIL_TEMPLATES=1: write_mail output is generated once per job and link set
+        # with placeholders for the candidate fields, and filled in locally per candidate
+        if mail_template_cache is None and os.getenv("EMAIL_TEMPLATES", "").lower() in ("1", "true", "yes"):
+            mail_template_cache = cache_from_env("mail_template_cache", "MAIL_TEMPLATE_CACHE", ttl=7 * 24 * 3600,
+                                                 max_entries=512, max_db_entries=20000)
+        self.mail_template_cache = mail_template_cache or None
+        # Candidates arriving together for one job share the call writing its template
+        self._template_flights = SingleFlight("mail_template")
+        self.prompts = {
+            "extract_jobs": PromptFile("extract_jobs.txt"),
+            "write_mail": PromptFile("write_mail.txt"),
+            "extract_and_write": PromptFile("extract_and_write.txt"),
+        }
+        # name -> (template, llm, runnable); rebuilt only when either one changes
+        self._runnables = {}
 
-    def extract_jobs(self, cleaned_text):
-        prompt_extract = PromptTemplate.from_template(
-            """
-            ### SCRAPED TEXT FROM WEBSITE:
-            {page_data}
-            ### INSTRUCTION:
-            The scraped text is from the career's page of a website.
-            Your job is to extract the job postings and return them in JSON format containing the following keys: `role`, `experience`, `skills` and `description`.
-            Only return the valid JSON.
-            ### VALID JSON (NO PREAMBLE):
-            """
-        )
-        chain_extract = prompt_extract | self.llm
-        res = chain_extract.invoke(input={"page_data": cleaned_text})
+    def _runnable(self, name):
+        """`prompt | llm` for a prompt, built once and shared by concurrent calls"""
+        template = self.prompts[name].current()
+        cached = self._runnables.get(name)
+        if cached is None or cached[0] is not template or cached[1] is not self.llm:
+            # Runnables are immutable, so a race here only builds one twice
+            cached = (template, self.llm, template | self.llm)
+            self._runnables[name] = cached
+        return cached[2]
+
+    def reload_prompts(self):
+        """Re-read every prompt file now; returns the names that changed"""
+        return [name for name, prompt in self.prompts.items() if prompt.reload()]
+
+    def _extract_chain(self):
+        return self._runnable("extract_jobs")
+
+    def _answered(self, res):
+        """Note the model that wrote res; True if it is model_name, so the answer may be cached under it"""
+        model = (getattr(res, "response_metadata", None) or {}).get("model_name") or self.model_name
+        note_models({model})
+        return model == self.model_name
+
+    def extraction_key(self, cleaned_text):
+        """Cache key for extract_jobs; changes whenever the page, prompt or model changes"""
+        digest = hashlib.sha256()
+        for part in (self.model_name, self.prompts["extract_jobs"].current().template, cleaned_text):
+            digest.update(part.encode("utf-8"))
+            digest.update(b"\0")
+        return digest.hexdigest()
+
+    def _cached_jobs(self, key):
+        if self.extraction_cache is None:
+            return None
+        jobs = self.extraction_cache.get(key)
+        # Hand out a copy so callers can't mutate the cached entry
+        return copy.deepcopy(jobs) if jobs is not None else None
+
+    def _store_jobs(self, key, jobs):
+        if self.extraction_cache is not None:
+            self.extraction_cache.set(key, jobs)
+
+    @staticmethod
+    def _parse_jobs(content):
         try:
-            json_parser = JsonOutputParser()
-            res = json_parser.parse(res.content)
+            res = JSON_PARSER.parse(content)
         except OutputParserException:
             raise OutputParserException("Context too big. Unable to parse jobs.")
         return res if isinstance(res, list) else [res]
 
-    def write_mail(self, job, links, your_name="Your Name", your_email="your.email@example.com", recipient_name=""):
+    def _extract_segment(self, segment):
+        key = self.extraction_key(segment)
+        jobs = self._cached_jobs(key)
+        if jobs is None:
+            res = self._extract_chain().invoke(input={"page_data": segment})
+            record_tokens("extract_jobs", res.usage_metadata)
+            jobs = self._parse_jobs(res.content)
+            if self._answered(res):
+                self._store_jobs(key, jobs)
+        return jobs
+
+    async def _aextract_segment(self, segment, llm_slots=None):
+        key = self.extraction_key(segment)
+        jobs = self._cached_jobs(key)
+        if jobs is None:
+            async with llm_slots or contextlib.nullcontext():
+                res = await self._extract_chain().ainvoke(input={"page_data": segment})
+            record_tokens("extract_jobs", res.usage_metadata)
+            jobs = self._parse_jobs(res.content)
+            if self._answered(res):
+                self._store_jobs(key, jobs)
+        return jobs
+
+    def extract_jobs(self, cleaned_text):
+        # Long pages are trimmed to their most job-relevant chunks, or split into
+        # several segments when they list multiple jobs, so the prompt stays in budget
+        segments = split_for_extraction(cleaned_text, self.token_budget)
+        if len(segments) == 1:
+            return self._extract_segment(segments[0])
+        return merge_jobs([self._extract_segment(segment) for segment in segments])
+
+    async def aextract_jobs(self, cleaned_text, llm_slots=None):
+        """
+        Async variant of extract_jobs that awaits the LLM instead of blocking the
+        event loop. With llm_slots (a semaphore), each segment's LLM call holds
+        one slot, so a multi-segment page counts once per call in flight.
+        """
+        segments = await asyncio.to_thread(split_for_extraction, cleaned_text, self.token_budget)
+        if len(segments) == 1:
+            return await self._aextract_segment(segments[0], llm_slots)
+        return merge_jobs(await asyncio.gather(*(self._aextract_segment(segment, llm_slots) for segment in segments)))
+
+    def _mail_inputs(self, job, links, your_name, your_email, recipient_name):
         # Extract job details for personalization
         role = job.get('role', 'the position')
         experience = job.get('experience', 'relevant experience')
@@ -50,103 +216,7 @@ class Chain:
         if links:
             link_list = "\n".join([f"• {link.get('links', '')}" for link in links if link.get('links')])
         
-        prompt_email = PromptTemplate.from_template(
-            """
-            ### JOB DESCRIPTION:
-            {job_description}
-
-            ### REQUIRED SKILLS:
-            {skills_text}
-
-            ### CANDIDATE INFORMATION:
-            Name: {your_name}
-            Email: {your_email}
-            
-            ### INSTRUCTION:
-            You are {your_name}. Write a professional, personalized cold email that introduces yourself and expresses interest in connecting regarding the {role} position at the company. The tone should be warm, professional, and genuine - like the reference template provided.
-
-            CRITICAL RULES FOR HIGH RESPONSE RATE:
-            
-            1. PROFESSIONAL TONE:
-               - Warm and friendly, not sales-like or aggressive
-               - Professional opening: "I hope this message finds you well"
-               - Sincere and authentic language
-               - Not overly formal or stiff
-               - Match the style of the reference template exactly
-            
-            2. PERSONALIZATION:
-               - Reference specific aspects of the role or team
-               - Show genuine interest in their work/initiatives
-               - Connect your background to their specific needs
-               - Mention something specific about the company
-            
-            3. BACKGROUND & SKILLS:
-               - Briefly mention relevant experience and skills
-               - Focus on alignment between your background and their work
-               - Be specific about your expertise areas
-               - Mention years of experience naturally
-            
-            4. VALUE PROPOSITION:
-               - What you can contribute or learn
-               - How your skills align with their initiatives
-               - Any relevant achievements (briefly, with context)
-               - Focus on contribution potential, not just credentials
-            
-            5. STRUCTURE & FORMAT:
-               - Clear subject line
-               - Professional greeting
-               - Brief introduction of yourself
-               - Skills and experience alignment
-               - Soft CTA for connection
-               - Professional closing
-               - Complete signature block
-            
-            6. PROHIBITED ELEMENTS:
-               - Overly sales-like language
-               - Generic placeholders like "[Insert...]"
-               - Aggressive CTAs or false urgency
-               - More than 150 words total
-               - Overly formal or stiff language
-               - Apologetic language ("I know you're busy...")
-            
-            ### EMAIL OUTPUT FORMAT:
-            
-            Subject: Introduction - {role} at Your Company
-            
-            {greeting}
-            
-            I hope this message finds you well.
-            
-            I am writing to introduce myself and express my interest in connecting with you regarding the {role} position at your company. I recently came across this opportunity and felt that my background and interests align well with the work your team is involved in.
-            
-            I have experience in {skills_text} with {experience}. [Generate 1-2 sentences about specific relevant achievements or background that directly relates to the role - be specific but concise, e.g., "I have led multiple projects delivering scalable solutions" or "My recent work has focused on building high-performance applications that handle millions of users".]
-            
-            I am keen to explore whether there may be an opportunity to contribute to your team's success and learn more about your current initiatives. I would appreciate the chance to have a brief conversation at your convenience to discuss how my skills might align with your needs.
-            
-            My portfolio and work samples: {link_list}
-            
-            Thank you for your time and consideration. I look forward to your response.
-            
-            Yours sincerely,
-            {your_name}
-            {your_email}
-            
-            ### VALIDATION CHECKLIST:
-            ☐ Professional and warm tone
-            ☐ Company/role personalization is specific
-            ☐ Skills and experience mentioned
-            ☐ Soft CTA for connection
-            ☐ Email is under 150 words
-            ☐ No placeholder text remains
-            ☐ Professional signature included
-            
-            Do not provide a preamble. Do not include the validation checklist in the output.
-            ### EMAIL (PROFESSIONAL CONNECTION OPTIMIZED):
-
-            """
-        )
-        chain_email = prompt_email | self.llm
-        res = chain_email.invoke({
+        return {
             "job_description": str(job), 
             "link_list": link_list,
             "your_name": your_name,
@@ -155,9 +225,177 @@ class Chain:
             "role": role,
             "skills_text": skills_text,
             "experience": experience
-        })
+        }
+
+    def _mail_chain(self):
+        return self._runnable("write_mail")
+
+    def _template_inputs(self, job, links):
+        inputs = self._mail_inputs(job, links, MAIL_PLACEHOLDERS["your_name"], MAIL_PLACEHOLDERS["your_email"], "")
+        inputs["greeting"] = MAIL_PLACEHOLDERS["greeting"]
+        return inputs
+
+    def mail_template_key(self, inputs):
+        """Cache key for a mail template: the job-dependent prompt inputs, prompt and model"""
+        digest = hashlib.sha256()
+        parts = [self.model_name, self.prompts["write_mail"].current().template]
+        parts += [inputs[name] for name in ("job_description", "role", "skills_text", "experience", "link_list")]
+        for part in parts:
+            digest.update(str(part).encode("utf-8"))
+            digest.update(b"\0")
+        return digest.hexdigest()
+
+    @staticmethod
+    def _valid_template(text):
+        # Every candidate field must be there to be filled, the greeting on a line of its
+        # own (not "Dear __GREETING__"), and no placeholder the model made up itself
+        found = set(PLACEHOLDER_PATTERN.findall(text))
+        if found != set(MAIL_PLACEHOLDERS.values()):
+            return False
+        return re.search(r"^\s*__GREETING__", text, re.MULTILINE) is not None
+
+    def fill_mail_template(self, template, your_name, your_email, recipient_name=""):
+        """A cached template with the candidate's fields filled in, or None if any placeholder is left"""
+        greeting = self._mail_inputs({}, [], your_name, your_email, recipient_name)["greeting"]
+        values = {"greeting": greeting, "your_name": your_name, "your_email": your_email}
+        # One pass, so a value that happens to look like a placeholder is never expanded again
+        by_placeholder = {MAIL_PLACEHOLDERS[field]: value for field, value in values.items()}
+        if any(found not in by_placeholder for found in PLACEHOLDER_PATTERN.findall(template)):
+            return None
+        return PLACEHOLDER_PATTERN.sub(lambda m: by_placeholder[m.group(0)], template)
+
+    def _cached_template(self, key):
+        entry = self.mail_template_cache.get(key)
+        return entry["template"] if entry is not None else None, entry is not None
+
+    def _store_template(self, key, res):
+        template = res.content.strip() if self._valid_template(res.content) else None
+        # Unusable answers are remembered too, so later candidates go straight to a
+        # personal call; a fallback model's answer is used once but never stored
+        if self._answered(res):
+            self.mail_template_cache.set(key, {"template": template})
+        return template
+
+    def _templated_mail(self, job, links, your_name, your_email, recipient_name):
+        """The email from a cached (or newly written) template; None to fall back to a personal call"""
+        inputs = self._template_inputs(job, links)
+        key = self.mail_template_key(inputs)
+        template, known = self._cached_template(key)
+        if not known:
+            res = self._mail_chain().invoke(inputs)
+            record_tokens("write_mail", res.usage_metadata)
+            template = self._store_template(key, res)
+        return self.fill_mail_template(template, your_name, your_email, recipient_name) if template else None
+
+    async def _atemplated_mail(self, job, links, your_name, your_email, recipient_name):
+        inputs = self._template_inputs(job, links)
+        key = self.mail_template_key(inputs)
+        template, known = self._cached_template(key)
+        if not known:
+            async def write_template():
+                res = await self._mail_chain().ainvoke(inputs)
+                record_tokens("write_mail", res.usage_metadata)
+                with track_models() as models:
+                    template = self._store_template(key, res)
+                return template, models
+
+            # Each caller notes the model in its own block; the shared call runs in another task
+            template, models = await self._template_flights.do(key, write_template)
+            note_models(models)
+        return self.fill_mail_template(template, your_name, your_email, recipient_name) if template else None
+
+    def _fused_inputs(self, cleaned_text, links, your_name, your_email, recipient_name):
+        inputs = self._mail_inputs({}, links, your_name, your_email, recipient_name)
+        return {
+            "page_data": select_relevant_text(cleaned_text, self.token_budget),
+            "link_list": inputs["link_list"] or "(none)",
+            "your_name": your_name,
+            "your_email": your_email,
+            "greeting": inputs["greeting"],
+        }
+
+    @staticmethod
+    def _parse_fused(content):
+        """(job, email) from a fused answer, or (None, None) when the page had no job"""
+        try:
+            res = JSON_PARSER.parse(content)
+        except OutputParserException:
+            raise OutputParserException("Unable to parse the job and email.")
+        if isinstance(res, list):
+            res = res[0] if res else {}
+        if not isinstance(res, dict):
+            raise OutputParserException("Unable to parse the job and email.")
+        if not res:
+            return None, None
+        email = res.pop("email", None)
+        if not isinstance(email, str) or not email.strip():
+            raise OutputParserException("The answer had no email.")
+        return res, email.strip()
+
+    def extract_and_write(self, cleaned_text, links, your_name="Your Name", your_email="your.email@example.com", recipient_name=""):
+        """
+        Fused mode: extract the first job on the page and write its email in one
+        LLM call. `links` come from a local pre-pass (Portfolio.skills_in_text)
+        since the job's skills aren't known before the call.
+        """
+        inputs = self._fused_inputs(cleaned_text, links, your_name, your_email, recipient_name)
+        res = self._runnable("extract_and_write").invoke(inputs)
+        record_tokens("extract_and_write", res.usage_metadata)
+        self._answered(res)
+        return self._parse_fused(res.content)
+
+    async def aextract_and_write(self, cleaned_text, links, your_name="Your Name", your_email="your.email@example.com", recipient_name=""):
+        inputs = self._fused_inputs(cleaned_text, links, your_name, your_email, recipient_name)
+        res = await self._runnable("extract_and_write").ainvoke(inputs)
+        record_tokens("extract_and_write", res.usage_metadata)
+        self._answered(res)
+        return self._parse_fused(res.content)
+
+    def write_mail(self, job, links, your_name="Your Name", your_email="your.email@example.com", recipient_name=""):
+        if self.mail_template_cache is not None:
+            email = self._templated_mail(job, links, your_name, your_email, recipient_name)
+            if email is not None:
+                return email
+        inputs = self._mail_inputs(job, links, your_name, your_email, recipient_name)
+        res = self._mail_chain().invoke(inputs)
+        record_tokens("write_mail", res.usage_metadata)
+        self._answered(res)
         return res.content
 
+    async def awrite_mail(self, job, links, your_name="Your Name", your_email="your.email@example.com", recipient_name=""):
+        """Async variant of write_mail that awaits the LLM instead of blocking the event loop"""
+        if self.mail_template_cache is not None:
+            email = await self._atemplated_mail(job, links, your_name, your_email, recipient_name)
+            if email is not None:
+                return email
+        inputs = self._mail_inputs(job, links, your_name, your_email, recipient_name)
+        res = await self._mail_chain().ainvoke(inputs)
+        record_tokens("write_mail", res.usage_metadata)
+        self._answered(res)
+        return res.content
+
+    async def astream_mail(self, job, links, your_name="Your Name", your_email="your.email@example.com", recipient_name=""):
+        """Stream the email text chunk by chunk as the LLM produces it"""
+        if self.mail_template_cache is not None:
+            # Only a template that is already cached is used; writing one can't be streamed
+            template, _ = self._cached_template(self.mail_template_key(self._template_inputs(job, links)))
+            email = self.fill_mail_template(template, your_name, your_email, recipient_name) if template else None
+            if email is not None:
+                yield email
+                return
+        inputs = self._mail_inputs(job, links, your_name, your_email, recipient_name)
+        usage = {}
+        async for chunk in self._mail_chain().astream(inputs):
+            # Token usage (and the model name) are reported on the final chunk(s) of the stream
+            for kind, count in (chunk.usage_metadata or {}).items():
+                if isinstance(count, int):
+                    usage[kind] = usage.get(kind, 0) + count
+            if (chunk.response_metadata or {}).get("model_name"):
+                self._answered(chunk)
+            if chunk.content:
+                yield chunk.content
+        record_tokens("write_mail", usage)
+
 if __name__ == "__main__":
     print(os.getenv("GROQ_API_KEY"))
 
@@ -0,0 +1,100 @@
+import gzip
+
+from starlette.datastructures import Headers, MutableHeaders
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+
+COMPRESSIBLE_TYPES = ("text/", "application/json", "application/javascript", "application/xml", "image/svg+xml")
+
+
+def accepted_encodings(header):
+    """Accept-Encoding as {coding: q}"""
+    accepted = {}
+    for part in header.split(","):
+        coding, _, params = part.strip().partition(";")
+        q = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                q = float(params[2:])
+            except ValueError:
+                q = 0.0
+        if coding:
+            accepted[coding.strip().lower()] = q
+    return accepted
+
+
+def choose_encoding(header):
+    """'br' (when the brotli package is installed) or 'gzip' if the client takes it, else None"""
+    accepted = accepted_encodings(header or "")
+    wildcard = accepted.get("*", 0.0)
+    for coding in (("br", "gzip") if brotli is not None else ("gzip",)):
+        if accepted.get(coding, wildcard) > 0:
+            return coding
+    return None
+
+
+class CompressionMiddleware:
+    """
+    Compresses complete responses with brotli or gzip, whichever the client
+    accepts (brotli only when the package is installed).
+
+    Streamed responses (SSE, NDJSON) pass through untouched so every event still
+    reaches the client as soon as it is sent. A compressed response's ETag is
+    marked weak, since the bytes on the wire differ from the original body.
+    """
+
+    def __init__(self, app, minimum_size=500, gzip_level=6, brotli_quality=5):
+        self.app = app
+        self.minimum_size = minimum_size
+        self.gzip_level = gzip_level
+        self.brotli_quality = brotli_quality
+
+    def compress(self, coding, body):
+        if coding == "br":
+            return brotli.compress(body, quality=self.brotli_quality)
+        # mtime=0 keeps the output (and so any cache keyed on it) the same across calls
+        return gzip.compress(body, compresslevel=self.gzip_level, mtime=0)
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        coding = choose_encoding(Headers(scope=scope).get("accept-encoding"))
+        if coding is None:
+            await self.app(scope, receive, send)
+            return
+
+        start = None
+
+        async def send_compressed(message):
+            nonlocal start
+            if message["type"] == "http.response.start":
+                start = message
+                return
+            if start is None:
+                # Headers already went out: streaming, or a body already handled
+                await send(message)
+                return
+            headers = MutableHeaders(raw=start["headers"])
+            body = message.get("body", b"")
+            compressible = headers.get("content-type", "").startswith(COMPRESSIBLE_TYPES)
+            if compressible and not message.get("more_body", False):
+                headers.add_vary_header("Accept-Encoding")
+                if len(body) >= self.minimum_size and "content-encoding" not in headers:
+                    body = self.compress(coding, body)
+                    headers["Content-Encoding"] = coding
+                    headers["Content-Length"] = str(len(body))
+                    etag = headers.get("etag")
+                    if etag and not etag.startswith("W/"):
+                        headers["ETag"] = f"W/{etag}"
+                    message = {"type": "http.response.body", "body": body}
+            response_start, start = start, None
+            await send(response_start)
+            await send(message)
+
+        await self.app(scope, receive, send_compressed)
@@ -0,0 +1,291 @@
+import asyncio
+import email.utils
+import os
+import random
+import threading
+import time
+from urllib.parse import urlsplit
+
+import httpx
+
+from app.metrics import SCRAPE_RETRIES
+
+
+# Browser-like headers, matching what WebBaseLoader sends by default
+DEFAULT_HEADERS = {
+    "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0 Safari/537.36",
+    "Accept": "text/html,application/xhtml+xml,application/xml;q=0.9,image/webp,*/*;q=0.8",
+    "Accept-Language": "en-US,en;q=0.5",
+    "Referer": "https://www.google.com/",
+    "DNT": "1",
+    "Upgrade-Insecure-Requests": "1",
+}
+
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+
+class ResponseTooLarge(Exception):
+    pass
+
+
+def _http2_available():
+    try:
+        import h2  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
+def retry_after_seconds(response):
+    """Seconds asked for by a Retry-After header (delta or HTTP date), or None"""
+    value = response.headers.get("Retry-After")
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        when = email.utils.parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    return max(0.0, when.timestamp() - time.time())
+
+
+class TokenBucket:
+    """
+    Request rate limit: `rate` requests per second with bursts of up to `burst`.
+
+    reserve() always takes a token and returns how long the caller must wait
+    before using it, so waiters are served in arrival order and the same bucket
+    works for threads and coroutines alike.
+    """
+
+    def __init__(self, rate, burst):
+        self.rate = rate
+        self.capacity = max(1.0, float(burst))
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self, now):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def reserve(self):
+        if self.rate <= 0:
+            return 0.0
+        with self._lock:
+            self._refill(time.monotonic())
+            self.tokens -= 1
+            return 0.0 if self.tokens >= 0 else -self.tokens / self.rate
+
+    def try_take(self):
+        """Take a token only if one is available right now"""
+        if self.rate <= 0:
+            return True
+        with self._lock:
+            self._refill(time.monotonic())
+            if self.tokens < 1:
+                return False
+            self.tokens -= 1
+            return True
+
+    def pause(self, seconds):
+        """Hold back every request that has not started yet for `seconds` (e.g. after a 429)"""
+        if self.rate <= 0 or seconds <= 0:
+            return
+        with self._lock:
+            self._refill(time.monotonic())
+            self.tokens = min(self.tokens, 0.0) - seconds * self.rate
+
+
+class ScrapeClient:
+    """
+    Shared HTTP client for fetching job pages.
+
+    Connections are pooled and kept alive across requests (HTTP/2 when the h2
+    package is installed), each host gets its own token bucket so bursts against
+    one ATS are spread out, and 429/5xx responses and connection errors are
+    retried with jittered exponential backoff that honours Retry-After. Bodies
+    larger than max_bytes are rejected while streaming.
+    """
+
+    def __init__(self, rate_per_host=5.0, burst_per_host=10, connect_timeout=5.0, read_timeout=20.0,
+                 max_retries=3, backoff_base=0.5, backoff_max=20.0, max_bytes=5 * 1024 * 1024,
+                 max_connections=100, max_keepalive=20, http2=None):
+        self.rate_per_host = rate_per_host
+        self.burst_per_host = burst_per_host
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.max_bytes = max_bytes
+        self.http2 = _http2_available() if http2 is None else http2
+        self._client_options = dict(
+            headers=DEFAULT_HEADERS,
+            follow_redirects=True,
+            timeout=httpx.Timeout(read_timeout, connect=connect_timeout),
+            limits=httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_keepalive),
+            http2=self.http2,
+        )
+        self._buckets = {}
+        self._lock = threading.Lock()
+        self._client = None
+        self._async_client = None
+        self._async_loop = None
+
+    @classmethod
+    def from_env(cls):
+        http2 = os.getenv("SCRAPE_HTTP2")
+        return cls(
+            rate_per_host=float(os.getenv("SCRAPE_RATE_PER_HOST", "5")),
+            burst_per_host=float(os.getenv("SCRAPE_BURST_PER_HOST", "10")),
+            connect_timeout=float(os.getenv("SCRAPE_CONNECT_TIMEOUT", "5")),
+            read_timeout=float(os.getenv("SCRAPE_READ_TIMEOUT", "20")),
+            max_retries=int(os.getenv("SCRAPE_MAX_RETRIES", "3")),
+            max_bytes=int(os.getenv("SCRAPE_MAX_BYTES", str(5 * 1024 * 1024))),
+            http2=None if http2 is None else http2.lower() in ("1", "true", "yes"),
+        )
+
+    def bucket(self, url):
+        host = (urlsplit(url).hostname or "").lower()
+        with self._lock:
+            if host not in self._buckets:
+                self._buckets[host] = TokenBucket(self.rate_per_host, self.burst_per_host)
+            return self._buckets[host]
+
+    def _sync_client(self):
+        with self._lock:
+            if self._client is None:
+                self._client = httpx.Client(**self._client_options)
+            return self._client
+
+    def _loop_client(self):
+        # An AsyncClient's pool belongs to the event loop it was first used on
+        loop = asyncio.get_running_loop()
+        if self._async_client is None or self._async_loop is not loop:
+            self._async_client = httpx.AsyncClient(**self._client_options)
+            self._async_loop = loop
+        return self._async_client
+
+    def _backoff(self, attempt, response=None):
+        """Delay before retry number `attempt` (1-based)"""
+        if response is not None:
+            requested = retry_after_seconds(response)
+            if requested is not None:
+                return min(requested, self.backoff_max)
+        # Full jitter keeps clients that failed together from retrying together
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** attempt))
+
+    def _check_length(self, response):
+        length = response.headers.get("Content-Length")
+        if length and length.isdigit() and int(length) > self.max_bytes:
+            raise ResponseTooLarge(f"{response.url} is {length} bytes (limit {self.max_bytes})")
+
+    def _finish(self, response, chunks):
+        # The body was decoded while streaming, so drop the headers describing the wire encoding
+        headers = [(k, v) for k, v in response.headers.multi_items()
+                   if k.lower() not in ("content-encoding", "content-length", "transfer-encoding")]
+        return httpx.Response(
+            response.status_code, headers=headers, content=b"".join(chunks), request=response.request
+        )
+
+    def _too_large(self, response, size):
+        if size > self.max_bytes:
+            raise ResponseTooLarge(f"{response.url} exceeded {self.max_bytes} bytes")
+
+    def _should_retry(self, attempt, response=None, error=None):
+        if attempt > self.max_retries:
+            return False
+        if error is not None:
+            SCRAPE_RETRIES.labels(type(error).__name__).inc()
+            return True
+        if response.status_code in RETRY_STATUSES:
+            SCRAPE_RETRIES.labels(str(response.status_code)).inc()
+            return True
+        return False
+
+    async def get(self, url, headers=None):
+        bucket = self.bucket(url)
+        attempt = 0
+        while True:
+            attempt += 1
+            wait = bucket.reserve()
+            if wait:
+                await asyncio.sleep(wait)
+            try:
+                async with self._loop_client().stream("GET", url, headers=headers) as response:
+                    self._check_length(response)
+                    chunks, size = [], 0
+                    async for chunk in response.aiter_bytes():
+                        size += len(chunk)
+                        self._too_large(response, size)
+                        chunks.append(chunk)
+            except httpx.TransportError as e:
+                if not self._should_retry(attempt, error=e):
+                    raise
+                await asyncio.sleep(self._backoff(attempt))
+                continue
+            response = self._finish(response, chunks)
+            if not self._should_retry(attempt, response=response):
+                return response
+            delay = self._backoff(attempt, response)
+            if response.status_code == 429:
+                bucket.pause(delay)
+            await asyncio.sleep(delay)
+
+    def get_sync(self, url, headers=None):
+        """Blocking variant of get for the Streamlit app"""
+        bucket = self.bucket(url)
+        attempt = 0
+        while True:
+            attempt += 1
+            wait = bucket.reserve()
+            if wait:
+                time.sleep(wait)
+            try:
+                with self._sync_client().stream("GET", url, headers=headers) as response:
+                    self._check_length(response)
+                    chunks, size = [], 0
+                    for chunk in response.iter_bytes():
+                        size += len(chunk)
+                        self._too_large(response, size)
+                        chunks.append(chunk)
+            except httpx.TransportError as e:
+                if not self._should_retry(attempt, error=e):
+                    raise
+                time.sleep(self._backoff(attempt))
+                continue
+            response = self._finish(response, chunks)
+            if not self._should_retry(attempt, response=response):
+                return response
+            delay = self._backoff(attempt, response)
+            if response.status_code == 429:
+                bucket.pause(delay)
+            time.sleep(delay)
+
+    async def aclose(self):
+        if self._async_client is not None:
+            await self._async_client.aclose()
+            self._async_client = None
+        self.close()
+
+    def close(self):
+        with self._lock:
+            if self._client is not None:
+                self._client.close()
+                self._client = None
+
+
+_default_client = None
+_default_client_lock = threading.Lock()
+
+
+def get_scrape_client():
+    """Process-wide ScrapeClient configured from SCRAPE_* environment variables"""
+    global _default_client
+    if _default_client is None:
+        with _default_client_lock:
+            if _default_client is None:
+                _default_client = ScrapeClient.from_env()
+    return _default_client
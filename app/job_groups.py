@@ -0,0 +1,50 @@
+import hashlib
+import re
+
+from app.portfolio import skill_tokens
+
+
+# Parenthesised notes and trailing " - London" / " | Remote" / ", Berlin" parts
+# name a posting's location or team rather than the role itself
+ROLE_QUALIFIERS = re.compile(r"\(.*?\)|\[.*?\]|\s[-–—|@]\s.*$|,.*$")
+ROLE_WORDS = re.compile(r"[a-z0-9+#.]+")
+
+# Fields that may differ between postings sharing one generated email
+POSTING_FIELDS = ("role", "experience")
+
+
+def normalize_role(role):
+    return " ".join(ROLE_WORDS.findall(ROLE_QUALIFIERS.sub(" ", str(role or "")).lower()))
+
+
+def job_fingerprint(job):
+    """
+    Role + skills fingerprint of an extracted job, or None when it has no role.
+    Postings of the same role in several locations share a fingerprint.
+    """
+    role = normalize_role(job.get("role"))
+    if not role:
+        return None
+    skills = job.get("skills") or []
+    if isinstance(skills, str):
+        skills = skills.split(",")
+    normalized = sorted({" ".join(skill_tokens(str(skill))) for skill in skills} - {""})
+    return hashlib.sha1("\0".join([role] + normalized).encode("utf-8")).hexdigest()[:16]
+
+
+def group_jobs(jobs):
+    """Indices of `jobs` grouped by fingerprint, in page order; each group's first job is written"""
+    groups = {}
+    for i, job in enumerate(jobs):
+        fingerprint = job_fingerprint(job) if isinstance(job, dict) else None
+        groups.setdefault(fingerprint if fingerprint is not None else f"#{i}", []).append(i)
+    return list(groups.values())
+
+
+def adapt_email(email, source_job, job):
+    """An email written for source_job, with job's own role and experience swapped in"""
+    for field in POSTING_FIELDS:
+        old, new = str(source_job.get(field) or ""), str(job.get(field) or "")
+        if old and new and old != new:
+            email = email.replace(old, new)
+    return email
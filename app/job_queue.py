@@ -0,0 +1,327 @@
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import socket
+import sqlite3
+import threading
+import time
+import uuid
+
+from app.cache import DEFAULT_CACHE_DIR
+
+
+logger = logging.getLogger(__name__)
+
+QUEUED, RUNNING, DONE, FAILED = "queued", "running", "done", "failed"
+
+
+class IdempotencyConflict(Exception):
+    """An idempotency key was reused with a different request body"""
+
+
+def _payload_hash(payload):
+    return hashlib.sha256(json.dumps(payload, sort_keys=True).encode("utf-8")).hexdigest()
+
+
+def _worker_alive(worker, current_worker):
+    """Whether the process behind a hostname:pid:random worker ID on this host still runs"""
+    if worker == current_worker:
+        return True
+    try:
+        pid = int(worker.split(":")[1])
+        if pid == os.getpid():
+            # Same PID, other worker ID: our predecessor, e.g. PID 1 in a restarted container
+            return False
+        os.kill(pid, 0)
+    except (IndexError, ValueError, ProcessLookupError):
+        return False
+    except PermissionError:
+        # Exists, but belongs to another user
+        return True
+    return True
+
+
+class JobQueue:
+    """
+    Durable job queue in a local SQLite file (WAL mode, shared by worker processes).
+
+    A worker claims a job by taking a lease on it and renews the lease while the
+    job runs. A job whose lease runs out (its worker died or the server restarted
+    mid-job) goes back to the queue and is retried, up to max_attempts runs in all.
+    A job that failed waits retry_backoff seconds before its next run, doubling
+    with each failure (capped at max_backoff), so its attempts don't all hit the
+    same broken site or rate-limited key back to back. Finished jobs are kept
+    for result_ttl seconds so clients can poll for them.
+    """
+
+    def __init__(self, db_path, lease_seconds=60, max_attempts=3, result_ttl=7 * 24 * 3600,
+                 retry_backoff=10.0, max_backoff=600.0):
+        self.db_path = db_path
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+        self.retry_backoff = retry_backoff
+        self.max_backoff = max_backoff
+        self.result_ttl = result_ttl
+        self._lock = threading.Lock()
+        self._writes_since_prune = 0
+        os.makedirs(os.path.dirname(os.path.abspath(db_path)), exist_ok=True)
+        self._db = sqlite3.connect(db_path, timeout=30, check_same_thread=False, isolation_level=None)
+        self._db.row_factory = sqlite3.Row
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS jobs ("
+            " id TEXT PRIMARY KEY, idempotency_key TEXT UNIQUE, payload_hash TEXT NOT NULL,"
+            " payload TEXT NOT NULL, status TEXT NOT NULL, result TEXT, error TEXT,"
+            " attempts INTEGER NOT NULL DEFAULT 0, worker TEXT, lease_until REAL, run_after REAL,"
+            " created_at REAL NOT NULL, updated_at REAL NOT NULL)"
+        )
+        columns = {row["name"] for row in self._db.execute("PRAGMA table_info(jobs)")}
+        if "run_after" not in columns:
+            # Queue files created before retry backoff existed
+            self._db.execute("ALTER TABLE jobs ADD COLUMN run_after REAL")
+        self._db.execute("CREATE INDEX IF NOT EXISTS jobs_status_created ON jobs (status, created_at)")
+
+    @classmethod
+    def from_env(cls):
+        return cls(
+            os.getenv("JOB_QUEUE_DB") or os.path.join(DEFAULT_CACHE_DIR, "jobs.sqlite3"),
+            lease_seconds=float(os.getenv("JOB_LEASE_SECONDS", "60")),
+            max_attempts=int(os.getenv("JOB_MAX_ATTEMPTS", "3")),
+            result_ttl=float(os.getenv("JOB_RESULT_TTL", str(7 * 24 * 3600))),
+            retry_backoff=float(os.getenv("JOB_RETRY_BACKOFF", "10")),
+            max_backoff=float(os.getenv("JOB_MAX_BACKOFF", "600")),
+        )
+
+    def submit(self, payload, idempotency_key=None):
+        """
+        Queue a job; returns (job, created). Re-submitting with the same
+        idempotency key returns the existing job instead of queueing another one.
+        """
+        digest = _payload_hash(payload)
+        now = time.time()
+        job_id = uuid.uuid4().hex
+        with self._lock:
+            try:
+                self._db.execute(
+                    "INSERT INTO jobs (id, idempotency_key, payload_hash, payload, status, created_at, updated_at)"
+                    " VALUES (?, ?, ?, ?, ?, ?, ?)",
+                    (job_id, idempotency_key, digest, json.dumps(payload), QUEUED, now, now)
+                )
+            except sqlite3.IntegrityError:
+                row = self._db.execute("SELECT * FROM jobs WHERE idempotency_key = ?", (idempotency_key,)).fetchone()
+                if row is None:
+                    raise
+                if row["payload_hash"] != digest:
+                    raise IdempotencyConflict(f"Idempotency key {idempotency_key!r} was used for a different request")
+                return self._job(row), False
+            self._maybe_prune()
+        return self.get(job_id), True
+
+    def get(self, job_id):
+        with self._lock:
+            row = self._db.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return self._job(row) if row is not None else None
+
+    def claim(self, worker):
+        """Lease the oldest runnable job to `worker`; returns the job or None"""
+        now = time.time()
+        with self._lock:
+            # BEGIN IMMEDIATE takes the write lock up front, so two processes can't claim the same row
+            self._db.execute("BEGIN IMMEDIATE")
+            try:
+                row = self._db.execute(
+                    "SELECT id FROM jobs WHERE (status = ? AND (run_after IS NULL OR run_after <= ?))"
+                    " OR (status = ? AND lease_until < ?) ORDER BY created_at LIMIT 1",
+                    (QUEUED, now, RUNNING, now)
+                ).fetchone()
+                if row is None:
+                    self._db.execute("COMMIT")
+                    return None
+                self._db.execute(
+                    "UPDATE jobs SET status = ?, worker = ?, lease_until = ?, attempts = attempts + 1, updated_at = ?"
+                    " WHERE id = ?",
+                    (RUNNING, worker, now + self.lease_seconds, now, row["id"])
+                )
+                job = self._db.execute("SELECT * FROM jobs WHERE id = ?", (row["id"],)).fetchone()
+                self._db.execute("COMMIT")
+            except BaseException:
+                self._db.execute("ROLLBACK")
+                raise
+        job = self._job(job)
+        if job["attempts"] > self.max_attempts:
+            # Its previous runs all died mid-job (lease ran out each time): give up on it
+            self.fail(job["id"], worker, "Job was interrupted too many times", retry=False)
+            return self.claim(worker)
+        return job
+
+    def renew(self, job_id, worker):
+        """Extend a running job's lease; False if the job is no longer ours"""
+        now = time.time()
+        with self._lock:
+            cursor = self._db.execute(
+                "UPDATE jobs SET lease_until = ?, updated_at = ? WHERE id = ? AND status = ? AND worker = ?",
+                (now + self.lease_seconds, now, job_id, RUNNING, worker)
+            )
+        return cursor.rowcount == 1
+
+    def complete(self, job_id, worker, result):
+        self._finish(job_id, worker, DONE, result=json.dumps(result))
+
+    def fail(self, job_id, worker, error, retry=True):
+        """Record a failed run: the job is queued again, after a backoff, while it has attempts left"""
+        with self._lock:
+            row = self._db.execute("SELECT attempts FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        if retry and row is not None and row["attempts"] < self.max_attempts:
+            run_after = time.time() + self.backoff(row["attempts"])
+            self._finish(job_id, worker, QUEUED, error=str(error), run_after=run_after)
+        else:
+            self._finish(job_id, worker, FAILED, error=str(error))
+
+    def backoff(self, attempts):
+        """Seconds to wait before the next run of a job that has failed `attempts` times"""
+        return min(self.max_backoff, self.retry_backoff * 2 ** max(0, attempts - 1))
+
+    def release(self, job_id, worker):
+        """Put a job back without counting the interrupted run (e.g. on shutdown)"""
+        now = time.time()
+        with self._lock:
+            self._db.execute(
+                "UPDATE jobs SET status = ?, worker = NULL, lease_until = NULL, attempts = MAX(attempts - 1, 0),"
+                " updated_at = ? WHERE id = ? AND status = ? AND worker = ?",
+                (QUEUED, now, job_id, RUNNING, worker)
+            )
+
+    def recover(self, worker_prefix, worker_id):
+        """
+        Requeue jobs left running by processes on this host (same worker prefix)
+        that no longer exist, without waiting for their leases to run out.
+        worker_id is the caller's own ID; every other one with our PID is a
+        previous process. Returns how many were requeued.
+        """
+        now = time.time()
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT id, worker FROM jobs WHERE status = ? AND worker LIKE ?", (RUNNING, f"{worker_prefix}:%")
+            ).fetchall()
+            dead = [row["id"] for row in rows if not _worker_alive(row["worker"], worker_id)]
+            for job_id in dead:
+                self._db.execute(
+                    "UPDATE jobs SET status = ?, worker = NULL, lease_until = NULL, updated_at = ?"
+                    " WHERE id = ? AND status = ?",
+                    (QUEUED, now, job_id, RUNNING)
+                )
+        return len(dead)
+
+    def _finish(self, job_id, worker, status, result=None, error=None, run_after=None):
+        now = time.time()
+        with self._lock:
+            self._db.execute(
+                "UPDATE jobs SET status = ?, result = ?, error = ?, worker = NULL, lease_until = NULL, run_after = ?,"
+                " updated_at = ? WHERE id = ? AND worker = ?",
+                (status, result, error, run_after, now, job_id, worker)
+            )
+
+    def _maybe_prune(self):
+        self._writes_since_prune += 1
+        if self._writes_since_prune >= 100:
+            self._writes_since_prune = 0
+            self._db.execute(
+                "DELETE FROM jobs WHERE status IN (?, ?) AND updated_at < ?",
+                (DONE, FAILED, time.time() - self.result_ttl)
+            )
+
+    def counts(self):
+        with self._lock:
+            rows = self._db.execute("SELECT status, COUNT(*) FROM jobs GROUP BY status").fetchall()
+        return {status: count for status, count in rows}
+
+    @staticmethod
+    def _job(row):
+        return {
+            "id": row["id"],
+            "status": row["status"],
+            "payload": json.loads(row["payload"]),
+            "result": json.loads(row["result"]) if row["result"] is not None else None,
+            "error": row["error"],
+            "attempts": row["attempts"],
+            "run_after": row["run_after"],
+            "created_at": row["created_at"],
+            "updated_at": row["updated_at"],
+        }
+
+
+class JobWorkers:
+    """
+    Runs queued jobs inside the server's event loop, `concurrency` at a time.
+
+    `handler` is an async callable taking a job's payload and returning its
+    (JSON serialisable) result. Workers wake up as soon as a job is submitted in
+    this process and poll every poll_interval seconds for jobs queued by other
+    processes or freed by an expired lease. Queue calls run in a worker thread,
+    since SQLite may wait up to its busy timeout for another process's write lock.
+    """
+
+    def __init__(self, queue, handler, concurrency=4, poll_interval=1.0):
+        self.queue = queue
+        self.handler = handler
+        self.concurrency = concurrency
+        self.poll_interval = poll_interval
+        # hostname:pid:random, so recover() can tell this process's jobs from a dead one's
+        self.worker_prefix = socket.gethostname()
+        self.worker_id = f"{self.worker_prefix}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self._wakeup = None
+        self._tasks = []
+
+    def notify(self):
+        """Wake idle workers after a submit"""
+        if self._wakeup is not None:
+            self._wakeup.set()
+
+    async def start(self):
+        recovered = await asyncio.to_thread(self.queue.recover, self.worker_prefix, self.worker_id)
+        if recovered:
+            logger.info("Requeued %d job(s) interrupted by a restart", recovered)
+        self._wakeup = asyncio.Event()
+        self._tasks = [asyncio.create_task(self._run()) for _ in range(self.concurrency)]
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    async def _run(self):
+        while True:
+            job = await asyncio.to_thread(self.queue.claim, self.worker_id)
+            if job is None:
+                self._wakeup.clear()
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout=self.poll_interval)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+            await self._process(job)
+
+    async def _process(self, job):
+        heartbeat = asyncio.create_task(self._heartbeat(job["id"]))
+        try:
+            result = await self.handler(job["payload"])
+        except asyncio.CancelledError:
+            # Shutting down: hand the job back so the next start picks it up at once
+            await asyncio.to_thread(self.queue.release, job["id"], self.worker_id)
+            raise
+        except Exception as e:
+            logger.warning("Job %s failed (attempt %d): %s", job["id"], job["attempts"], e)
+            await asyncio.to_thread(self.queue.fail, job["id"], self.worker_id, e)
+        else:
+            await asyncio.to_thread(self.queue.complete, job["id"], self.worker_id, result)
+        finally:
+            heartbeat.cancel()
+
+    async def _heartbeat(self, job_id):
+        while True:
+            await asyncio.sleep(self.queue.lease_seconds / 3)
+            await asyncio.to_thread(self.queue.renew, job_id, self.worker_id)
@@ -0,0 +1,340 @@
+import asyncio
+import os
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from langchain_core.runnables import Runnable
+
+from app.http_client import TokenBucket
+from app.metrics import LLM_CONCURRENCY_LIMIT, LLM_REQUESTS
+
+FALLBACK_MODEL = "llama-3.1-8b-instant"
+
+# Models that answered the LLM calls made inside the current track_models() block
+_answered_by = ContextVar("cold_email_answered_by", default=None)
+
+
+@contextmanager
+def track_models():
+    """
+    Collect the names of the models answering LLM calls made inside the block.
+
+    The pool may hand a call to its fallback model, so output generated in the
+    block is only cacheable under Chain.model_name if that is all the set holds.
+    """
+    models = set()
+    token = _answered_by.set(models)
+    try:
+        yield models
+    finally:
+        _answered_by.reset(token)
+
+
+def note_models(models):
+    """Add models to the current track_models() block, if any"""
+    current = _answered_by.get()
+    if current is not None:
+        current.update(models)
+
+
+def is_rate_limit(error):
+    """True for a provider 429, whichever SDK raised it"""
+    return getattr(error, "status_code", None) == 429 or type(error).__name__ == "RateLimitError"
+
+
+def is_retryable(error):
+    """Rate limits, 5xx responses and connection problems are worth another backend"""
+    if is_rate_limit(error):
+        return True
+    status = getattr(error, "status_code", None)
+    if isinstance(status, int):
+        return status >= 500
+    return type(error).__name__ in ("APIConnectionError", "APITimeoutError", "ConnectError", "ReadTimeout")
+
+
+def retry_after(error, default=2.0):
+    response = getattr(error, "response", None)
+    value = getattr(response, "headers", {}).get("retry-after") if response is not None else None
+    try:
+        return max(0.0, float(value))
+    except (TypeError, ValueError):
+        return default
+
+
+class AIMDLimiter:
+    """
+    Concurrency limit that grows additively while calls are healthy and halves on
+    throttling or slow responses, like TCP congestion control.
+
+    A call counts as healthy when it succeeds within latency_target seconds; the
+    limit then grows by 1/limit, i.e. by about one slot per limit-sized round.
+    """
+
+    def __init__(self, initial=4, minimum=1, maximum=64, latency_target=30.0, decrease=0.5):
+        self.limit = float(initial)
+        self.minimum = minimum
+        self.maximum = maximum
+        self.latency_target = latency_target
+        self.decrease = decrease
+        self.in_flight = 0
+        self._last_decrease = 0.0
+
+    @property
+    def available(self):
+        return self.in_flight < int(self.limit)
+
+    def on_success(self, latency):
+        if latency > self.latency_target:
+            self.on_overload()
+        elif self.in_flight + 1 >= int(self.limit):
+            # Only grow when the current limit is actually being used
+            self.limit = min(self.maximum, self.limit + 1.0 / self.limit)
+
+    def on_overload(self):
+        # Calls that were already in flight when the first 429 arrived will fail
+        # too; count that whole burst as one congestion event
+        now = time.monotonic()
+        if now - self._last_decrease < 1.0:
+            return
+        self._last_decrease = now
+        self.limit = max(self.minimum, self.limit * self.decrease)
+
+
+class LLMBackend:
+    """One model behind one API key, with its own limiter, rate budget and cooldown"""
+
+    def __init__(self, name, llm, fallback=False, limiter=None, requests_per_minute=None):
+        self.name = name
+        self.llm = llm
+        self.fallback = fallback
+        self.limiter = limiter or AIMDLimiter()
+        self.rate = TokenBucket(requests_per_minute / 60.0, max(1, requests_per_minute // 6)) if requests_per_minute else None
+        self.cooldown_until = 0.0
+        self.counters = {"requests": 0, "ok": 0, "rate_limited": 0, "errors": 0, "cancelled": 0}
+        LLM_CONCURRENCY_LIMIT.labels(name).set(int(self.limiter.limit))
+
+    def ready(self, now):
+        return now >= self.cooldown_until and self.limiter.available
+
+    def load(self):
+        return self.limiter.in_flight / max(1, int(self.limiter.limit))
+
+
+class LLMPool(Runnable):
+    """
+    Chat model runnable spread over several backends (API keys and/or models).
+
+    Each call goes to the least loaded primary backend that is not cooling down,
+    has a free slot under its AIMD limit and is within its requests-per-minute
+    budget. A 429 halves that backend's limit and parks it for the Retry-After
+    period, and the call is retried on another backend. Fallback backends (a
+    smaller, faster model) only take calls once the primaries have been saturated
+    for fallback_wait seconds. Drop-in for a chat model: `prompt | pool` works.
+    """
+
+    def __init__(self, backends, max_attempts=3, fallback_wait=2.0, acquire_timeout=120.0):
+        if not backends:
+            raise ValueError("LLMPool needs at least one backend")
+        self.backends = list(backends)
+        self.max_attempts = max_attempts
+        self.fallback_wait = fallback_wait
+        self.acquire_timeout = acquire_timeout
+        self._lock = threading.Lock()
+        self._cond = threading.Condition(self._lock)
+        self._async_waiters = []
+
+    @property
+    def InputType(self):
+        return self.backends[0].llm.InputType
+
+    @property
+    def OutputType(self):
+        return self.backends[0].llm.OutputType
+
+    def _select(self, waited, exclude):
+        now = time.monotonic()
+        primaries = [b for b in self.backends if not b.fallback and b not in exclude]
+        candidates = [b for b in primaries if b.ready(now)]
+        if not candidates:
+            saturated = waited >= self.fallback_wait or all(now < b.cooldown_until for b in primaries)
+            if saturated:
+                candidates = [b for b in self.backends if b.fallback and b not in exclude and b.ready(now)]
+        for backend in sorted(candidates, key=LLMBackend.load):
+            if backend.rate is None or backend.rate.try_take():
+                backend.limiter.in_flight += 1
+                backend.counters["requests"] += 1
+                return backend
+        return None
+
+    def _wait_hint(self):
+        # Cooldowns and rate budgets free up without a release, so waiters also
+        # wake up on their own once the earliest cooldown is over
+        now = time.monotonic()
+        pending = [b.cooldown_until - now for b in self.backends if b.cooldown_until > now]
+        return min([0.25] + pending)
+
+    def _acquire_sync(self, exclude):
+        start = time.monotonic()
+        with self._cond:
+            while True:
+                waited = time.monotonic() - start
+                backend = self._select(waited, exclude)
+                if backend is not None:
+                    return backend
+                if waited > self.acquire_timeout:
+                    raise TimeoutError("No LLM backend became available")
+                self._cond.wait(self._wait_hint())
+
+    async def _acquire(self, exclude):
+        loop = asyncio.get_running_loop()
+        start = time.monotonic()
+        while True:
+            with self._lock:
+                waited = time.monotonic() - start
+                backend = self._select(waited, exclude)
+                if backend is not None:
+                    return backend
+                if waited > self.acquire_timeout:
+                    raise TimeoutError("No LLM backend became available")
+                future = loop.create_future()
+                self._async_waiters.append((loop, future))
+                timeout = self._wait_hint()
+            await asyncio.wait([future], timeout=timeout)
+
+    def _release(self, backend, started, error=None):
+        latency = time.monotonic() - started
+        with self._cond:
+            backend.limiter.in_flight -= 1
+            if error is None:
+                backend.counters["ok"] += 1
+                backend.limiter.on_success(latency)
+                outcome = "ok"
+            elif not isinstance(error, Exception):
+                # Cancelled, or a stream closed early: not a sign of the backend's health
+                backend.counters["cancelled"] += 1
+                outcome = "cancelled"
+            elif is_rate_limit(error):
+                backend.counters["rate_limited"] += 1
+                backend.limiter.on_overload()
+                backend.cooldown_until = max(backend.cooldown_until, time.monotonic() + retry_after(error))
+                outcome = "rate_limited"
+            else:
+                backend.counters["errors"] += 1
+                outcome = "error"
+            LLM_REQUESTS.labels(backend.name, outcome).inc()
+            LLM_CONCURRENCY_LIMIT.labels(backend.name).set(int(backend.limiter.limit))
+            self._cond.notify_all()
+            waiters, self._async_waiters = self._async_waiters, []
+        for loop, future in waiters:
+            loop.call_soon_threadsafe(_wake, future)
+
+    def _give_up(self, error, attempt):
+        return attempt >= self.max_attempts or not is_retryable(error)
+
+    def invoke(self, input, config=None, **kwargs):
+        tried = set()
+        for attempt in range(1, self.max_attempts + 1):
+            backend = self._acquire_sync(tried if len(tried) < len(self.backends) else set())
+            started = time.monotonic()
+            try:
+                result = backend.llm.invoke(input, config, **kwargs)
+            except Exception as e:
+                self._release(backend, started, e)
+                if self._give_up(e, attempt):
+                    raise
+                tried.add(backend)
+                continue
+            except BaseException as e:
+                self._release(backend, started, e)
+                raise
+            self._release(backend, started)
+            return result
+
+    async def ainvoke(self, input, config=None, **kwargs):
+        tried = set()
+        for attempt in range(1, self.max_attempts + 1):
+            backend = await self._acquire(tried if len(tried) < len(self.backends) else set())
+            started = time.monotonic()
+            try:
+                result = await backend.llm.ainvoke(input, config, **kwargs)
+            except Exception as e:
+                self._release(backend, started, e)
+                if self._give_up(e, attempt):
+                    raise
+                tried.add(backend)
+                continue
+            except BaseException as e:
+                self._release(backend, started, e)
+                raise
+            self._release(backend, started)
+            return result
+
+    async def astream(self, input, config=None, **kwargs):
+        tried = set()
+        for attempt in range(1, self.max_attempts + 1):
+            backend = await self._acquire(tried if len(tried) < len(self.backends) else set())
+            started = time.monotonic()
+            streamed = False
+            try:
+                async for chunk in backend.llm.astream(input, config, **kwargs):
+                    streamed = True
+                    yield chunk
+            except Exception as e:
+                self._release(backend, started, e)
+                # Chunks already sent can't be taken back, so only retry before the first one
+                if streamed or self._give_up(e, attempt):
+                    raise
+                tried.add(backend)
+                continue
+            except BaseException as e:
+                # Cancelled, or the consumer closed the stream (GeneratorExit)
+                self._release(backend, started, e)
+                raise
+            self._release(backend, started)
+            return
+
+    def stats(self):
+        with self._lock:
+            return {
+                backend.name: {
+                    **backend.counters,
+                    "limit": int(backend.limiter.limit),
+                    "in_flight": backend.limiter.in_flight,
+                    "cooling_down": backend.cooldown_until > time.monotonic(),
+                }
+                for backend in self.backends
+            }
+
+
+def _wake(future):
+    if not future.done():
+        future.set_result(None)
+
+
+def groq_pool_from_env(model_name):
+    """
+    LLMPool over every key in GROQ_API_KEYS (comma separated, falls back to
+    GROQ_API_KEY), with GROQ_FALLBACK_MODEL behind the same keys ("" disables it).
+    """
+    from langchain_groq import ChatGroq
+
+    keys = [k.strip() for k in os.getenv("GROQ_API_KEYS", "").split(",") if k.strip()]
+    if not keys:
+        keys = [os.getenv("GROQ_API_KEY")]
+    fallback_model = os.getenv("GROQ_FALLBACK_MODEL", FALLBACK_MODEL)
+    rpm = int(os.getenv("GROQ_RPM_PER_KEY", "0")) or None
+    initial = int(os.getenv("LLM_INITIAL_CONCURRENCY_PER_KEY", "4"))
+    latency_target = float(os.getenv("LLM_LATENCY_TARGET", "30"))
+
+    def backend(model, i, key, fallback):
+        # The pool does its own retrying across keys, so the SDK must not retry internally
+        llm = ChatGroq(temperature=0, groq_api_key=key, model_name=model, max_retries=0)
+        limiter = AIMDLimiter(initial=initial, latency_target=latency_target)
+        return LLMBackend(f"{model}#{i}", llm, fallback=fallback, limiter=limiter, requests_per_minute=rpm)
+
+    backends = [backend(model_name, i, key, False) for i, key in enumerate(keys)]
+    if fallback_model and fallback_model != model_name:
+        backends += [backend(fallback_model, i, key, True) for i, key in enumerate(keys)]
+    return LLMPool(backends)
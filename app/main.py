@@ -1,226 +1,148 @@
 
 import os
+import re
 import sys
 import streamlit as st
-from langchain_community.document_loaders import WebBaseLoader
 from urllib.parse import quote
 
 # Add parent directory to path for imports
 sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
 from app.chains import Chain
-from app.portfolio import Portfolio
+from app.portfolio import Portfolio, portfolio_sources
 from app.utils import clean_text
+from app.pipeline import extract_jobs_sync, iter_job_emails_sync, scrape_sync
 
-# Custom CSS for modern dark-themed UI
-st.markdown("""
-    <style>
-    @import url('https://fonts.googleapis.com/css2?family=Inter:wght@300;400;500;600;700&display=swap');
-    
-    * {
-        font-family: 'Inter', sans-serif;
-    }
-    
-    /* Dark theme background */
-    .stApp {
-        background: linear-gradient(135deg, #0a0f1c 0%, #1a1f3c 50%, #0d1421 100%);
-        min-height: 100vh;
-    }
-    
-    /* Glassmorphism card */
-    .glass-card {
-        background: rgba(30, 41, 70, 0.6);
-        backdrop-filter: blur(20px);
-        border: 1px solid rgba(255, 255, 255, 0.1);
-        border-radius: 1.5rem;
-        padding: 2rem;
-        box-shadow: 
-            0 25px 50px -12px rgba(0, 0, 0, 0.5),
-            0 0 0 1px rgba(255, 255, 255, 0.05);
-    }
-    
-    /* Header styling */
-    .main-header {
-        font-size: 2.5rem;
-        font-weight: 700;
-        color: #bfdbfe;
-        text-align: center;
-        margin-bottom: 0.5rem;
-    }
-    
-    .subtitle-text {
-        color: #94a3b8;
-        text-align: center;
-        font-size: 1.1rem;
-        margin-bottom: 2rem;
-    }
-    
-    /* Section titles */
-    .section-title {
-        font-size: 1.25rem;
-        font-weight: 600;
-        color: #60a5fa;
-        margin-bottom: 1rem;
-        display: flex;
-        align-items: center;
-        gap: 0.5rem;
-    }
-    
-    /* Input field styling */
-    .stTextInput > div > div {
-        background: rgba(15, 23, 42, 0.8) !important;
-        border: 1px solid rgba(255, 255, 255, 0.1) !important;
-        border-radius: 0.75rem !important;
-        transition: all 0.3s ease;
-    }
-    
-    .stTextInput > div > div:focus-within {
-        border-color: #60a5fa !important;
-        box-shadow: 0 0 20px rgba(96, 165, 250, 0.2) !important;
-    }
-    
-    .stTextInput input {
-        color: white !important;
-        padding: 0.75rem 1rem !important;
-    }
-    
-    .stTextInput input::placeholder {
-        color: rgba(148, 163, 184, 0.5) !important;
-    }
-    
-    /* Helper text */
-    .helper-text {
-        color: #64748b;
-        font-size: 0.75rem;
-        margin-top: 0.25rem;
-    }
-    
-    /* Label styling */
-    label {
-        color: #cbd5e1 !important;
-        font-weight: 500 !important;
-        margin-bottom: 0.5rem !important;
-    }
-    
-    /* Button styling */
-    .stButton > button {
-        width: 100%;
-        background: linear-gradient(135deg, #3b82f6 0%, #2563eb 100%) !important;
-        color: white !important;
-        font-weight: 600 !important;
-        border: none !important;
-        border-radius: 9999px !important;
-        padding: 0.75rem 2rem !important;
-        font-size: 1rem !important;
-        transition: all 0.3s ease !important;
-    }
-    
-    .stButton > button:hover {
-        background: linear-gradient(135deg, #60a5fa 0%, #3b82f6 100%) !important;
-        transform: translateY(-2px) !important;
-        box-shadow: 0 10px 30px rgba(59, 130, 246, 0.3) !important;
-    }
-    
-    /* Success/Error messages */
-    .stSuccess {
-        background: rgba(34, 197, 94, 0.1) !important;
-        border: 1px solid rgba(34, 197, 94, 0.3) !important;
-        color: #22c55e !important;
-        border-radius: 0.5rem !important;
-    }
-    
-    .stError {
-        background: rgba(239, 68, 68, 0.1) !important;
-        border: 1px solid rgba(239, 68, 68, 0.3) !important;
-        color: #ef4444 !important;
-        border-radius: 0.5rem !important;
-    }
-    
-    .stInfo {
-        background: rgba(59, 130, 246, 0.1) !important;
-        border: 1px solid rgba(59, 130, 246, 0.3) !important;
-        color: #60a5fa !important;
-        border-radius: 0.5rem !important;
-    }
-    
-    /* Code block styling */
-    .stCode {
-        background: rgba(15, 23, 42, 0.8) !important;
-        border-radius: 0.75rem !important;
-        border: 1px solid rgba(255, 255, 255, 0.1) !important;
-    }
-    
-    /* Divider */
-    hr {
-        border-color: rgba(255, 255, 255, 0.1) !important;
-        margin: 2rem 0 !important;
-    }
-    
-    /* Gmail button styling */
-    .gmail-button {
-        display: inline-flex;
-        align-items: center;
-        gap: 0.5rem;
-        background: linear-gradient(135deg, #ea4335 0%, #d93025 100%);
-        color: white;
-        padding: 0.75rem 1.5rem;
-        border-radius: 9999px;
-        text-decoration: none;
-        font-weight: 600;
-        transition: all 0.3s ease;
-        border: none;
-        cursor: pointer;
-    }
-    
-    .gmail-button:hover {
-        background: linear-gradient(135deg, #f87171 0%, #ea4335 100%);
-        transform: translateY(-2px);
-        box-shadow: 0 10px 30px rgba(234, 67, 53, 0.3);
-    }
-    
-    /* Spinner customization */
-    .stSpinner {
-        color: #60a5fa !important;
-    }
-    
-    /* Job card styling */
-    .job-card {
-        background: rgba(15, 23, 42, 0.6);
-        border: 1px solid rgba(255, 255, 255, 0.1);
-        border-radius: 1rem;
-        padding: 1.5rem;
-        margin-bottom: 1.5rem;
-    }
-    
-    .job-title {
-        color: #60a5fa;
-        font-size: 1.25rem;
-        font-weight: 600;
-        margin: 0;
-    }
-    
-    .job-meta {
-        color: #94a3b8;
-        margin-top: 0.5rem;
-    }
-    
-    /* Footer */
-    .footer-text {
-        color: #64748b;
-        text-align: center;
-        font-size: 0.875rem;
-        margin-top: 2rem;
-    }
-    
-    /* Column layout fix */
-    .row-widget {
-        margin-bottom: 0 !important;
-    }
-    </style>
-""", unsafe_allow_html=True)
+STYLE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "style.css")
+
+# Streamlit re-runs this script on every interaction; everything below is built
+# once per process and shared by all sessions
+
+@st.cache_resource
+def get_chain():
+    return Chain()
+
+
+@st.cache_resource(max_entries=1)
+def _load_portfolio(sources, mtimes_ns):
+    portfolio = Portfolio(list(sources))
+    portfolio.load_portfolio()
+    return portfolio
+
+
+def get_portfolio(sources=None):
+    """The shared Portfolio, rebuilt only when one of its files changes"""
+    sources = tuple(sources or portfolio_sources())
+    return _load_portfolio(sources, tuple(os.stat(path).st_mtime_ns for path in sources))
+
+
+@st.cache_resource
+def start_metrics_server():
+    """
+    Serve this process's stage metrics for Prometheus on STREAMLIT_METRICS_PORT
+    (off when unset). The API process serves its own on GET /metrics.
+    """
+    port = os.getenv("STREAMLIT_METRICS_PORT")
+    if port:
+        from prometheus_client import start_http_server
+        start_http_server(int(port), addr=os.getenv("STREAMLIT_METRICS_ADDR", "0.0.0.0"))
+    return port
+
+
+@st.cache_resource
+def _page_style():
+    # Comments and indentation only cost bytes on every rerun
+    with open(STYLE_PATH, encoding="utf-8") as f:
+        css = re.sub(r"/\*.*?\*/", "", f.read(), flags=re.S)
+    return "<style>" + " ".join(css.split()) + "</style>"
+
+
+RESULTS_KEY = "job_email_results"
+
+# Emails written at the same time for a page with several postings
+EMAIL_WORKERS = int(os.getenv("STREAMLIT_EMAIL_WORKERS", "4"))
+
+
+def render_job(job):
+    # Display job info - dark theme styling
+    st.markdown(f"""
+    <div style="background: rgba(15, 23, 42, 0.8); border: 1px solid rgba(255, 255, 255, 0.1); padding: 15px; border-radius: 10px; margin-bottom: 20px;">
+        <h4 style="margin: 0; color: #60a5fa;">📋 {job.get('role', 'Unknown Role')}</h4>
+        <p style="margin: 5px 0 0 0; color: #94a3b8;">💼 {job.get('experience', 'Experience not specified')}</p>
+    </div>
+    """, unsafe_allow_html=True)
+    
+    skills = job.get('skills', [])
+    if skills:
+        st.markdown(f"""
+        <div style="background: rgba(59, 130, 246, 0.1); border: 1px solid rgba(59, 130, 246, 0.2); padding: 10px 15px; border-radius: 8px; margin-bottom: 15px;">
+            <span style="color: #60a5fa; font-weight: 600;">🛠️ Skills:</span>
+            <span style="color: #cbd5e1; margin-left: 8px;">{", ".join(skills[:5])}{"..." if len(skills) > 5 else ""}</span>
+        </div>
+        """, unsafe_allow_html=True)
+
+
+def render_email(slot, job, email):
+    """Fill a job's placeholder with its email, or with the error that stopped it"""
+    if email is None:
+        slot.info("⏳ This email was not finished. Click Generate Email to try again.")
+        return
+    with slot.container():
+        if isinstance(email, Exception):
+            st.error(f"❌ Could not write this email: {str(email)}")
+            st.markdown("---")
+            return
+        
+        st.markdown("### 📧 Generated Email")
+        
+        # Display email in a styled container
+        st.markdown(f'''
+        <div style="background: rgba(15, 23, 42, 0.9); border: 1px solid rgba(255, 255, 255, 0.1); border-left: 4px solid #3b82f6; border-radius: 12px; padding: 20px; margin-bottom: 15px;">
+            <pre style="white-space: pre-wrap; font-family: 'Inter', sans-serif; font-size: 0.9rem; color: #e2e8f0; margin: 0;">{email}</pre>
+        </div>
+        ''', unsafe_allow_html=True)
+        
+        # Add Gmail button
+        subject = quote(f"Job Application - {job.get('role', 'Position')}")
+        body = quote(email)
+        gmail_url = f"https://mail.google.com/mail/?view=cm&fs=1&tf=1&su={subject}&body={body}"
+        
+        st.markdown(f'''
+            <center>
+                <a href="{gmail_url}" target="_blank" class="gmail-button">
+                    📧 Send to Gmail
+                </a>
+            </center>
+        ''', unsafe_allow_html=True)
+        st.markdown("---")
+
+
+def generate_job_emails(llm, portfolio, results, your_name, your_email, recipient_name):
+    """
+    Write every job's email in a small thread pool. Each job card is drawn up
+    front with a placeholder that is filled as soon as its email is done, in
+    whatever order they finish. Worker threads only call the LLM; all Streamlit
+    calls stay on the script thread. Duplicate postings of one role (same
+    role and skills) share the email written for the first of them.
+    """
+    jobs = results["jobs"]
+    slots = []
+    for job in jobs:
+        render_job(job)
+        slot = st.empty()
+        slot.info("⏳ Writing email...")
+        slots.append(slot)
+
+    for i, email in iter_job_emails_sync(llm, portfolio, jobs, your_name, your_email, recipient_name,
+                                         workers=EMAIL_WORKERS):
+        results["emails"][i] = email
+        render_email(slots[i], jobs[i], email)
 
 
 def create_streamlit_app(llm, portfolio, clean_text):
+    # Custom CSS for modern dark-themed UI (has to be sent on every run)
+    st.markdown(_page_style(), unsafe_allow_html=True)
+    
     # Header with envelope icon
     st.markdown('''
         <div style="text-align: center; margin-bottom: 2rem;">
@@ -289,11 +211,8 @@ def create_streamlit_app(llm, portfolio, clean_text):
     if submit_button:
         try:
             with st.spinner('🔍 Scraping job posting...'):
-                loader = WebBaseLoader([url_input])
-                data = loader.load().pop().page_content
-                
-            with st.spinner('🧹 Cleaning text...'):
-                cleaned_data = clean_text(data)
+                # Served from the scrape cache (raw HTML + cleaned text) when the URL was seen recently
+                cleaned_data = scrape_sync(url_input, cleaner=clean_text)
                 
             if not cleaned_data.strip():
                 st.error("❌ Could not extract text from the URL. The page might be blocking scrapers or requiring JavaScript.")
@@ -301,7 +220,8 @@ def create_streamlit_app(llm, portfolio, clean_text):
             else:
                 with st.spinner('📝 Generating email...'):
                     portfolio.load_portfolio()
-                    jobs = llm.extract_jobs(cleaned_data)
+                    # Chain's extraction cache is keyed on the page, prompt and model
+                    jobs = extract_jobs_sync(llm, cleaned_data)
                 
                 if not jobs:
                     st.error("❌ Could not extract job details from the page.")
@@ -309,69 +229,28 @@ def create_streamlit_app(llm, portfolio, clean_text):
                 else:
                     st.success("✅ Email generated successfully!")
                     st.markdown("---")
-                    
-                    for job in jobs:
-                        # Display job info - dark theme styling
-                        st.markdown(f"""
-                        <div style="background: rgba(15, 23, 42, 0.8); border: 1px solid rgba(255, 255, 255, 0.1); padding: 15px; border-radius: 10px; margin-bottom: 20px;">
-                            <h4 style="margin: 0; color: #60a5fa;">📋 {job.get('role', 'Unknown Role')}</h4>
-                            <p style="margin: 5px 0 0 0; color: #94a3b8;">💼 {job.get('experience', 'Experience not specified')}</p>
-                        </div>
-                        """, unsafe_allow_html=True)
-                        
-                        skills = job.get('skills', [])
-                        if skills:
-                            st.markdown(f"""
-                            <div style="background: rgba(59, 130, 246, 0.1); border: 1px solid rgba(59, 130, 246, 0.2); padding: 10px 15px; border-radius: 8px; margin-bottom: 15px;">
-                                <span style="color: #60a5fa; font-weight: 600;">🛠️ Skills:</span>
-                                <span style="color: #cbd5e1; margin-left: 8px;">{", ".join(skills[:5])}{"..." if len(skills) > 5 else ""}</span>
-                            </div>
-                            """, unsafe_allow_html=True)
-                        
-                        links = portfolio.query_links(skills)
-                        email = llm.write_mail(
-                            job, 
-                            links,
-                            your_name=your_name,
-                            your_email=your_email,
-                            recipient_name=recipient_name
-                        )
-                        
-                        st.markdown("### 📧 Generated Email")
-                        
-                        # Display email in a styled container
-                        st.markdown(f'''
-                        <div style="background: rgba(15, 23, 42, 0.9); border: 1px solid rgba(255, 255, 255, 0.1); border-left: 4px solid #3b82f6; border-radius: 12px; padding: 20px; margin-bottom: 15px;">
-                            <pre style="white-space: pre-wrap; font-family: 'Inter', sans-serif; font-size: 0.9rem; color: #e2e8f0; margin: 0;">{email}</pre>
-                        </div>
-                        ''', unsafe_allow_html=True)
-                        
-                        # Add Gmail button
-                        subject = quote(f"Job Application - {job.get('role', 'Position')}")
-                        body = quote(email)
-                        gmail_url = f"https://mail.google.com/mail/?view=cm&fs=1&tf=1&su={subject}&body={body}"
-                        
-                        st.markdown(f'''
-                            <center>
-                                <a href="{gmail_url}" target="_blank" class="gmail-button">
-                                    📧 Send to Gmail
-                                </a>
-                            </center>
-                        ''', unsafe_allow_html=True)
-                        st.markdown("---")
+                    # Kept across reruns so other widget changes just redraw the results
+                    results = {"jobs": jobs, "emails": [None] * len(jobs)}
+                    st.session_state[RESULTS_KEY] = results
+                    generate_job_emails(llm, portfolio, results, your_name, your_email, recipient_name)
                         
         except Exception as e:
             st.error(f"❌ An Error Occurred: {str(e)}")
             st.info("💡 Try using a different job posting URL. Some websites block automated scrapers.")
+    elif st.session_state.get(RESULTS_KEY):
+        results = st.session_state[RESULTS_KEY]
+        st.markdown("---")
+        for job, email in zip(results["jobs"], results["emails"]):
+            render_job(job)
+            render_email(st.empty(), job, email)
 
 
 if __name__ == "__main__":
-    chain = Chain()
-    portfolio = Portfolio()
     st.set_page_config(
         layout="wide", 
         page_title="Job Application Email Generator", 
         page_icon="📧",
         initial_sidebar_state="expanded"
     )
-    create_streamlit_app(chain, portfolio, clean_text)
+    start_metrics_server()
+    create_streamlit_app(get_chain(), get_portfolio(), clean_text)
@@ -0,0 +1,148 @@
+import json
+import logging
+import os
+import time
+import uuid
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from prometheus_client import CONTENT_TYPE_LATEST, Counter, Gauge, Histogram, REGISTRY, generate_latest
+from prometheus_client.core import CounterMetricFamily, GaugeMetricFamily
+
+
+STAGE_BUCKETS = (0.001, 0.005, 0.01, 0.05, 0.1, 0.25, 0.5, 1, 2, 4, 8, 16, 32, 64)
+
+STAGE_LATENCY = Histogram(
+    "cold_email_stage_seconds", "Latency of each pipeline stage", ["stage"], buckets=STAGE_BUCKETS
+)
+STAGE_ERRORS = Counter("cold_email_stage_errors_total", "Exceptions raised per pipeline stage", ["stage"])
+SCRAPE_RETRIES = Counter("cold_email_scrape_retries_total", "Scrape requests retried, by status or error", ["reason"])
+LLM_TOKENS = Counter("cold_email_llm_tokens_total", "LLM tokens used per call type", ["call", "kind"])
+LLM_REQUESTS = Counter("cold_email_llm_requests_total", "LLM calls per pool backend by outcome", ["backend", "outcome"])
+EMAILS_REUSED = Counter("cold_email_emails_reused_total", "Emails copied from a duplicate posting's generation")
+COALESCED_CALLS = Counter(
+    "cold_email_coalesced_calls_total", "Calls that joined an identical call already in flight", ["call"]
+)
+LLM_CONCURRENCY_LIMIT = Gauge("cold_email_llm_concurrency_limit", "Current AIMD concurrency limit per backend", ["backend"])
+
+TRACE_ENABLED = os.getenv("TRACE_LOG", "").lower() in ("1", "true", "yes")
+trace_logger = logging.getLogger("cold_email.trace")
+if TRACE_ENABLED and not trace_logger.handlers:
+    # One JSON object per line on stderr, independent of the app's logging setup
+    _handler = logging.StreamHandler()
+    _handler.setFormatter(logging.Formatter("%(message)s"))
+    trace_logger.addHandler(_handler)
+    trace_logger.setLevel(logging.INFO)
+    trace_logger.propagate = False
+
+# Spans recorded for the request currently being handled (None outside a trace)
+_current_trace = ContextVar("cold_email_trace", default=None)
+
+
+@contextmanager
+def stage(name):
+    """Time a pipeline stage into the stage histogram and the current request trace"""
+    start = time.perf_counter()
+    error = None
+    try:
+        yield
+    except BaseException as e:
+        error = e
+        STAGE_ERRORS.labels(name).inc()
+        raise
+    finally:
+        elapsed = time.perf_counter() - start
+        STAGE_LATENCY.labels(name).observe(elapsed)
+        spans = _current_trace.get()
+        if spans is not None:
+            span = {"stage": name, "seconds": round(elapsed, 6)}
+            if error is not None:
+                span["error"] = type(error).__name__
+            spans.append(span)
+
+
+@contextmanager
+def trace(name, **fields):
+    """
+    Wrap a whole request: times it as a stage and, with TRACE_LOG=1, logs one JSON
+    line with every stage span recorded while it ran.
+
+    Yields the list of spans. A trace opened inside another one also hands its
+    spans up to the outer trace.
+    """
+    parent = _current_trace.get()
+    spans = []
+    token = _current_trace.set(spans)
+    start = time.perf_counter()
+    status = "ok"
+    try:
+        with stage(name):
+            yield spans
+    except BaseException as e:
+        status = type(e).__name__
+        raise
+    finally:
+        _current_trace.reset(token)
+        if parent is not None:
+            parent.extend(spans)
+        if TRACE_ENABLED:
+            trace_logger.info(json.dumps({
+                "trace_id": uuid.uuid4().hex,
+                "name": name,
+                "status": status,
+                "seconds": round(time.perf_counter() - start, 6),
+                "spans": spans,
+                **fields,
+            }))
+
+
+def record_tokens(call, usage):
+    """Count input/output tokens from an LLM response's usage_metadata"""
+    usage = usage or {}
+    for kind in ("input_tokens", "output_tokens"):
+        if usage.get(kind):
+            LLM_TOKENS.labels(call, kind.replace("_tokens", "")).inc(usage[kind])
+
+
+class CacheStatsCollector:
+    """Exports the counters kept by registered caches (anything with a stats() dict)"""
+
+    def __init__(self):
+        self._caches = {}
+
+    def register(self, name, cache):
+        self._caches[name] = cache
+
+    def collect(self):
+        events = CounterMetricFamily("cold_email_cache_events", "Cache lookups by outcome", labels=["cache", "event"])
+        entries = GaugeMetricFamily("cold_email_cache_memory_entries", "Entries held in memory", labels=["cache"])
+        for name, cache in self._caches.items():
+            for key, value in _flatten(cache.stats()):
+                if key.endswith("memory_entries"):
+                    entries.add_metric([name], value)
+                elif isinstance(value, (int, float)):
+                    events.add_metric([name, key], value)
+        yield events
+        yield entries
+
+
+def _flatten(stats, prefix=""):
+    for key, value in stats.items():
+        if isinstance(value, dict):
+            yield from _flatten(value, f"{prefix}{key}_")
+        else:
+            yield f"{prefix}{key}", value
+
+
+cache_collector = CacheStatsCollector()
+REGISTRY.register(cache_collector)
+
+
+def register_cache(name, cache):
+    if cache is not None:
+        cache_collector.register(name, cache)
+
+
+def render_metrics():
+    """Prometheus text exposition of every metric: (body, content type)"""
+    return generate_latest(REGISTRY), CONTENT_TYPE_LATEST
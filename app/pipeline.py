@@ -0,0 +1,287 @@
+import asyncio
+import contextvars
+import copy
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from contextlib import asynccontextmanager
+from urllib.parse import urlsplit
+
+from langchain_core.exceptions import OutputParserException
+
+from app.job_groups import adapt_email, group_jobs
+from app.llm_pool import note_models, track_models
+from app.metrics import EMAILS_REUSED, stage
+from app.scraper import load_cleaned_page, load_cleaned_page_sync, normalize_url
+from app.singleflight import SingleFlight
+from app.utils import clean_text
+
+
+# Identical requests arriving together (one posting shared around a team) share
+# one page fetch and one extraction; each still gets its own write_mail call
+scrape_flights = SingleFlight("scrape")
+extract_flights = SingleFlight("extract_jobs")
+
+
+class ConcurrencyLimiter:
+    """Caps in-flight scrapes globally and per target host"""
+
+    def __init__(self, max_concurrency=20, per_host=4):
+        self.per_host = per_host
+        self._global = asyncio.Semaphore(max_concurrency)
+        self._hosts = {}
+
+    def _host_semaphore(self, url):
+        host = (urlsplit(url).hostname or "").lower()
+        if host not in self._hosts:
+            self._hosts[host] = asyncio.Semaphore(self.per_host)
+        return self._hosts[host]
+
+    @asynccontextmanager
+    async def limit(self, url):
+        # Wait for the host slot first so a busy host never holds a global slot idle
+        async with self._host_semaphore(url):
+            async with self._global:
+                yield
+
+
+@asynccontextmanager
+async def _maybe(limiter_cm):
+    if limiter_cm is None:
+        yield
+    else:
+        async with limiter_cm:
+            yield
+
+
+async def scrape_page(job_url, scrape_limiter=None):
+    """Cleaned page text; concurrent calls for the same normalized URL share one fetch"""
+    async def fetch():
+        async with _maybe(scrape_limiter.limit(job_url) if scrape_limiter else None):
+            return await load_cleaned_page(job_url)
+
+    with stage("scrape"):
+        return await scrape_flights.do(normalize_url(job_url), fetch)
+
+
+async def extract_jobs(chain, cleaned_data, llm_slots=None):
+    """
+    chain.aextract_jobs; concurrent calls for the same page text (and model and
+    prompt) share one LLM call. Every caller gets its own copy of the jobs.
+    """
+    async def extract():
+        # Slots are taken per segment call inside, not for the whole page
+        with track_models() as models:
+            jobs = await chain.aextract_jobs(cleaned_data, llm_slots)
+        return jobs, models
+
+    with stage("extract_jobs"):
+        jobs, models = await extract_flights.do((id(chain), chain.extraction_key(cleaned_data)), extract)
+    # The shared call ran in its own task: record who answered it for this caller too
+    note_models(models)
+    return copy.deepcopy(jobs)
+
+
+def _links_from_page(portfolio, cleaned_data):
+    """Portfolio links for the skills named on the page, before any LLM call"""
+    return portfolio.query_links(portfolio.skills_in_text(cleaned_data))
+
+
+async def generate_email_for_url(chain, portfolio, job_url, your_name, your_email, recipient_name="",
+                                 scrape_limiter=None, llm_slots=None):
+    """
+    Run scrape -> clean -> extract -> write for a single job URL (or, when
+    chain.fused is set, scrape -> clean -> one extract_and_write call).
+
+    Returns the generated email, or None when the page has no usable text or jobs
+    so the caller can fall back to a basic template.
+    """
+    cleaned_data = await scrape_page(job_url, scrape_limiter)
+
+    if not cleaned_data.strip():
+        return None
+
+    if chain.fused:
+        with stage("query_links"):
+            links = await asyncio.to_thread(_links_from_page, portfolio, cleaned_data)
+        try:
+            async with _maybe(llm_slots):
+                with stage("extract_and_write"):
+                    _, email = await chain.aextract_and_write(
+                        cleaned_data,
+                        links,
+                        your_name=your_name,
+                        your_email=your_email,
+                        recipient_name=recipient_name
+                    )
+            return email
+        except OutputParserException:
+            # A malformed fused answer falls back to the two-call flow below
+            pass
+
+    jobs = await extract_jobs(chain, cleaned_data, llm_slots)
+    if not jobs:
+        return None
+
+    # Generate email for the first job
+    job = jobs[0]
+    skills = job.get('skills', [])
+    with stage("query_links"):
+        links = await asyncio.to_thread(portfolio.query_links, skills)
+
+    async with _maybe(llm_slots):
+        with stage("write_mail"):
+            return await chain.awrite_mail(
+                job,
+                links,
+                your_name=your_name,
+                your_email=your_email,
+                recipient_name=recipient_name
+            )
+
+
+async def generate_emails_for_url(chain, portfolio, job_url, your_name, your_email, recipient_name="",
+                                  scrape_limiter=None, llm_slots=None):
+    """
+    Scrape -> clean -> extract, then write an email for every job on the page.
+
+    Jobs with the same role+skills fingerprint (one role posted in several
+    locations) share a single write_mail call; the copies get their own role and
+    experience substituted in. Returns one {"job", "email", "duplicate_of"} entry
+    per job in page order (with "error" instead of "email" if writing failed), or
+    None when the page has no usable text or jobs.
+    """
+    cleaned_data = await scrape_page(job_url, scrape_limiter)
+    if not cleaned_data.strip():
+        return None
+
+    jobs = await extract_jobs(chain, cleaned_data, llm_slots)
+    jobs = [job for job in jobs if isinstance(job, dict)]
+    if not jobs:
+        return None
+
+    async def write(job):
+        with stage("query_links"):
+            links = await asyncio.to_thread(portfolio.query_links, job.get('skills', []))
+        async with _maybe(llm_slots):
+            with stage("write_mail"):
+                return await chain.awrite_mail(
+                    job,
+                    links,
+                    your_name=your_name,
+                    your_email=your_email,
+                    recipient_name=recipient_name
+                )
+
+    groups = group_jobs(jobs)
+    emails = await asyncio.gather(*(write(jobs[group[0]]) for group in groups), return_exceptions=True)
+
+    results = [None] * len(jobs)
+    for group, email in zip(groups, emails):
+        first = group[0]
+        for i in group:
+            entry = {"job": jobs[i], "duplicate_of": first if i != first else None}
+            if isinstance(email, Exception):
+                entry["error"] = str(email)
+            else:
+                entry["email"] = email if i == first else adapt_email(email, jobs[first], jobs[i])
+            results[i] = entry
+        if not isinstance(email, Exception):
+            EMAILS_REUSED.inc(len(group) - 1)
+    return results
+
+
+async def stream_email_for_url(chain, portfolio, job_url, your_name, your_email, recipient_name=""):
+    """
+    Same flow as generate_email_for_url, but yields (event, data) pairs: a progress
+    event after each stage, then the email as "token" events while the LLM writes it.
+
+    Yields ("fallback", ...) and stops when the page has no usable text or jobs.
+    """
+    cleaned_data = await scrape_page(job_url)
+    yield "scraped", {"characters": len(cleaned_data)}
+    if not cleaned_data.strip():
+        yield "fallback", {"reason": "No text could be extracted from the page"}
+        return
+
+    jobs = await extract_jobs(chain, cleaned_data)
+    if not jobs:
+        yield "fallback", {"reason": "No job postings found on the page"}
+        return
+    job = jobs[0]
+    yield "extracted", {"role": job.get('role'), "jobs": len(jobs)}
+
+    skills = job.get('skills', [])
+    with stage("query_links"):
+        links = await asyncio.to_thread(portfolio.query_links, skills)
+    yield "links", {"links": [link.get('links') for link in links]}
+
+    with stage("write_mail"):
+        async for token in chain.astream_mail(
+            job,
+            links,
+            your_name=your_name,
+            your_email=your_email,
+            recipient_name=recipient_name
+        ):
+            yield "token", {"text": token}
+
+
+# Blocking building blocks for the Streamlit app (and the benchmark that drives it)
+
+def scrape_sync(job_url, cleaner=clean_text):
+    with stage("scrape"):
+        return load_cleaned_page_sync(job_url, cleaner=cleaner)
+
+
+def extract_jobs_sync(chain, cleaned_data):
+    with stage("extract_jobs"):
+        return chain.extract_jobs(cleaned_data)
+
+
+def write_job_email_sync(chain, portfolio, job, your_name, your_email, recipient_name=""):
+    """Match portfolio links for one extracted job and write its email"""
+    skills = job.get('skills', [])
+    with stage("query_links"):
+        links = portfolio.query_links(skills)
+    with stage("write_mail"):
+        return chain.write_mail(
+            job,
+            links,
+            your_name=your_name,
+            your_email=your_email,
+            recipient_name=recipient_name
+        )
+
+
+def iter_job_emails_sync(chain, portfolio, jobs, your_name, your_email, recipient_name="", workers=4):
+    """
+    Write every job's email in a small thread pool and yield (index, email) as
+    each one is done, in whatever order they finish. Duplicate postings of one
+    role share the email written for the first of them. A failed write yields
+    its exception in place of the email.
+    """
+    groups = group_jobs(jobs)
+    with ThreadPoolExecutor(max_workers=max(1, min(workers, len(groups)))) as executor:
+        # Each call runs in a copy of this context so its stage spans reach the current trace
+        futures = {
+            executor.submit(
+                contextvars.copy_context().run,
+                write_job_email_sync,
+                chain,
+                portfolio,
+                jobs[group[0]],
+                your_name=your_name,
+                your_email=your_email,
+                recipient_name=recipient_name
+            ): group
+            for group in groups
+        }
+        for future in as_completed(futures):
+            group = futures[future]
+            try:
+                email = future.result()
+            except Exception as e:
+                yield from ((i, e) for i in group)
+                continue
+            EMAILS_REUSED.inc(len(group) - 1)
+            for i in group:
+                yield i, email if i == group[0] else adapt_email(email, jobs[group[0]], jobs[i])
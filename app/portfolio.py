@@ -1,53 +1,225 @@
 import os
-import pandas as pd
-import uuid
+import csv
+import hashlib
+import json
 import re
+import sys
+from array import array
+from bisect import bisect_left
 from collections import Counter
 
 
+PORTFOLIO_CSV = os.path.join(os.path.dirname(os.path.abspath(__file__)), "resource", "my_portfolio.csv")
+
+# Tokens keep the punctuation that is part of a technology name (node.js, c++, c#, .net)
+SKILL_TOKEN_PATTERN = re.compile(r"\.?[a-z0-9][a-z0-9+#]*(?:\.[a-z0-9][a-z0-9+#]*)*")
+
+# Common spellings mapped to the canonical token used in the index
+SKILL_ALIASES = {
+    "node": "node.js",
+    "nodejs": "node.js",
+    "postgres": "postgresql",
+    "psql": "postgresql",
+    "reactjs": "react",
+    "react.js": "react",
+    "vue": "vue.js",
+    "vuejs": "vue.js",
+    "angularjs": "angular",
+    "js": "javascript",
+    "ts": "typescript",
+    "golang": "go",
+    "k8s": "kubernetes",
+    "mongo": "mongodb",
+    "dotnet": ".net",
+    "py": "python",
+    "tf": "tensorflow",
+}
+
+
+def skill_tokens(text):
+    """Lowercase, tokenize and alias-normalize a skill or techstack string"""
+    return tuple(SKILL_ALIASES.get(token, token) for token in SKILL_TOKEN_PATTERN.findall(text.lower()))
+
+
+def portfolio_sources():
+    """Portfolio files from PORTFOLIO_FILES (comma separated), or the bundled CSV"""
+    paths = [path.strip() for path in os.getenv("PORTFOLIO_FILES", "").split(",") if path.strip()]
+    return paths or [PORTFOLIO_CSV]
+
+
+def read_portfolio_rows(path):
+    """
+    Stream (techstack, link) pairs from a portfolio file: CSV with Techstack and
+    Links columns, or JSONL (.jsonl/.ndjson) with one {"Techstack", "Links"}
+    object per line. Rows missing either value are skipped.
+    """
+    if path.endswith((".jsonl", ".ndjson")):
+        with open(path, encoding="utf-8") as f:
+            for line in f:
+                if line.strip():
+                    record = json.loads(line)
+                    techstack = record.get("Techstack", record.get("techstack"))
+                    link = record.get("Links", record.get("links"))
+                    if techstack and link:
+                        yield str(techstack), str(link)
+        return
+    with open(path, newline="", encoding="utf-8-sig") as f:
+        reader = csv.reader(f)
+        header = next(reader, None)
+        if header is None:
+            return
+        columns = [name.strip() for name in header]
+        techstack_col, link_col = columns.index("Techstack"), columns.index("Links")
+        for record in reader:
+            if len(record) > max(techstack_col, link_col) and record[techstack_col] and record[link_col]:
+                yield record[techstack_col], record[link_col]
+
+
+def _contains_phrase(tokens, phrase):
+    n = len(phrase)
+    first = phrase[0]
+    for i in range(len(tokens) - n + 1):
+        if tokens[i] == first and tokens[i:i + n] == phrase:
+            return True
+    return False
+
+
+def _has(postings, row_id):
+    # Row ids are appended in increasing order, so every posting list is sorted
+    i = bisect_left(postings, row_id)
+    return i < len(postings) and postings[i] == row_id
+
+
 class Portfolio:
-    def __init__(self, file_path=None):
-        if file_path is None:
-            file_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), "resource", "my_portfolio.csv")
-        self.file_path = file_path
-        self.data = pd.read_csv(file_path)
-        self.portfolio_store = {}
+    """
+    Portfolio projects (techstack -> link) loaded from one or more CSV/JSONL files.
+
+    Rows are kept as two parallel columns (techstacks, links) and indexed by
+    interned skill token, with each token's row ids in a compact array, so large
+    portfolios stay small in memory. A techstack that appears more than once
+    keeps its first position and its last link.
+    """
+
+    def __init__(self, file_path=None, retrieval=None, embedder=None, index_dir=None):
+        # A single path or a list of paths, loaded in order
+        sources = file_path or portfolio_sources()
+        self.sources = [sources] if isinstance(sources, str) else list(sources)
+        self.file_path = self.sources[0]
+        # Row id -> techstack / link, and token -> array of row ids
+        self._techstacks = []
+        self._links = []
+        self._index = {}
+        # Tokenized techstack entries ("Ruby on Rails" -> ("ruby", "on", "rails")) -> spelling
+        self._skill_phrases = {}
+        # "keyword" (default) matches skill tokens exactly; "vector" ranks rows by
+        # embedding similarity so related skills ("React Native" / "mobile apps") match
+        self.retrieval = retrieval or os.getenv("PORTFOLIO_RETRIEVAL", "keyword")
+        self.embedder = embedder
+        self.index_dir = index_dir
+        self._vector_index = None
+
+    def __len__(self):
+        return len(self._techstacks)
 
     def load_portfolio(self):
-        if not self.portfolio_store:
-            for _, row in self.data.iterrows():
-                techstack = row["Techstack"]
-                link = row["Links"]
-                self.portfolio_store[techstack] = link
-
-    def _calculate_similarity(self, skills, techstack):
-        """Calculate similarity between job skills and techstack using keyword matching"""
-        if not skills:
-            return 0
-        skills_normalized = [s.lower().strip() for s in skills]
-        techstack_normalized = techstack.lower()
-        
-        matches = 0
-        for skill in skills_normalized:
-            # Check for word boundaries to avoid partial matches
-            if re.search(r'\b' + re.escape(skill) + r'\b', techstack_normalized):
-                matches += 1
-        
-        return matches / len(skills) if skills else 0
-
-    def query_links(self, skills):
+        if not self._techstacks:
+            row_ids = {}
+            # Techstack entry ("Ruby on Rails") -> its interned token phrase, while loading
+            phrases = {}
+            for path in self.sources:
+                for techstack, link in read_portfolio_rows(path):
+                    row_id = row_ids.get(techstack)
+                    if row_id is None:
+                        row_ids[techstack] = self._add_row(techstack, link, phrases)
+                    else:
+                        self._links[row_id] = link
+            if self.retrieval == "vector":
+                self._build_vector_index()
+
+    def _add_row(self, techstack, link, phrases):
+        row_id = len(self._techstacks)
+        self._techstacks.append(techstack)
+        self._links.append(link)
+        # No token spans a comma, so the row's tokens are those of its entries
+        tokens = set()
+        for skill in techstack.split(","):
+            phrase = phrases.get(skill)
+            if phrase is None:
+                # Interned, so every row and index key shares one string per token
+                phrase = phrases[skill] = tuple(sys.intern(token) for token in skill_tokens(skill))
+                if phrase and phrase not in self._skill_phrases:
+                    self._skill_phrases[phrase] = skill.strip()
+            tokens.update(phrase)
+        for token in tokens:
+            postings = self._index.get(token)
+            if postings is None:
+                postings = self._index[token] = array("I")
+            postings.append(row_id)
+        return row_id
+
+    def _build_vector_index(self):
+        from app.vector_index import PortfolioVectorIndex
+
+        index_dir = self.index_dir
+        if index_dir is None:
+            from app.cache import DEFAULT_CACHE_DIR
+            key = "\n".join(os.path.abspath(path) for path in self.sources)
+            digest = hashlib.sha1(key.encode("utf-8")).hexdigest()[:12]
+            index_dir = os.path.join(DEFAULT_CACHE_DIR, "portfolio_index", digest)
+        self._vector_index = PortfolioVectorIndex(index_dir, embedder=self.embedder)
+        # The unchanged-source shortcut tracks a single file; with several the row keys decide
+        source_path = self.file_path if len(self.sources) == 1 else None
+        self._vector_index.sync(self._techstacks, source_path=source_path)
+
+    def _matching_rows(self, skill):
+        """Row ids whose techstack contains the skill as a whole token phrase"""
+        phrase = skill_tokens(skill)
+        if not phrase:
+            return set()
+        postings = [self._index.get(token) for token in set(phrase)]
+        if not all(postings):
+            return set()
+        postings.sort(key=len)
+        candidates = set(postings[0])
+        for other in postings[1:]:
+            candidates = {row_id for row_id in candidates if _has(other, row_id)}
+            if not candidates:
+                return set()
+        if len(phrase) == 1:
+            return candidates
+        return {row_id for row_id in candidates if _contains_phrase(skill_tokens(self._techstacks[row_id]), phrase)}
+
+    def skills_in_text(self, text, limit=10):
+        """
+        Portfolio skills mentioned in free text (e.g. a scraped job page), most
+        frequent first. A cheap local stand-in for LLM skill extraction: only whole
+        techstack entries count, so "on" never matches "Ruby on Rails".
+        """
+        tokens = skill_tokens(text)
+        longest = max((len(phrase) for phrase in self._skill_phrases), default=0)
+        counts = Counter()
+        for n in range(1, longest + 1):
+            counts.update(tuple(tokens[i:i + n]) for i in range(len(tokens) - n + 1))
+        found = [(counts[phrase], skill) for phrase, skill in self._skill_phrases.items() if counts[phrase]]
+        found.sort(key=lambda item: -item[0])
+        return [skill for _, skill in found[:limit]]
+
+    def query_links(self, skills, top_k=2):
         """Query portfolio links based on skills similarity"""
         if not skills:
             return []
-        
-        similarities = []
-        for techstack, link in self.portfolio_store.items():
-            sim = self._calculate_similarity(skills, techstack)
-            if sim > 0:
-                similarities.append((sim, link))
-        
-        # Sort by similarity and get top results
-        similarities.sort(key=lambda x: x[0], reverse=True)
-        top_results = similarities[:2]
-        
-        return [{"links": link} for _, link in top_results]
+        if isinstance(skills, str):
+            skills = skills.split(",")
+        if self._vector_index is not None:
+            row_ids = self._vector_index.query([str(skill) for skill in skills], top_k=top_k)
+            return [{"links": self._links[row_id]} for row_id in row_ids]
+
+        # Similarity is the fraction of job skills found in a row's techstack;
+        # only rows sharing at least one token with a skill are ever scored
+        matches = Counter()
+        for skill in skills:
+            matches.update(self._matching_rows(str(skill)))
+
+        # Ties keep portfolio file order, as the previous sorted() scan did
+        ranked = sorted(matches.items(), key=lambda item: (-item[1], item[0]))
+        return [{"links": self._links[row_id]} for row_id, _ in ranked[:top_k]]
@@ -0,0 +1,140 @@
+import math
+import re
+
+
+# Words that signal job-posting content, and page chrome that does not
+JOB_KEYWORDS = {
+    "requirements": 3.0, "responsibilities": 3.0, "qualifications": 3.0, "qualification": 2.0,
+    "experience": 2.0, "skills": 2.0, "role": 1.5, "duties": 2.0, "preferred": 1.5,
+    "required": 1.5, "degree": 1.0, "years": 1.0, "engineer": 1.0, "developer": 1.0,
+    "manager": 1.0, "team": 0.5, "position": 1.0, "job": 1.0, "apply": 1.0,
+    "salary": 1.0, "benefits": 0.5, "location": 0.5, "remote": 0.5, "hybrid": 0.5,
+    "cookie": -2.0, "cookies": -2.0, "privacy": -2.0, "copyright": -2.0, "login": -1.5,
+    "signin": -1.5, "subscribe": -1.5, "newsletter": -1.5, "javascript": -0.5,
+}
+
+# Section headers that usually open a new posting's body; several of them on one
+# page means it lists multiple jobs
+POSTING_MARKERS = ("responsibilities", "requirements", "qualifications")
+
+WORD_PATTERN = re.compile(r"\S+")
+
+
+def estimate_tokens(text):
+    """Rough token count for English text (about four characters per token)"""
+    return len(text) // 4 + 1
+
+
+def chunk_words(text, words_per_chunk=120):
+    """Split cleaned text into consecutive chunks of roughly words_per_chunk words"""
+    words = WORD_PATTERN.findall(text)
+    return [" ".join(words[i:i + words_per_chunk]) for i in range(0, len(words), words_per_chunk)]
+
+
+def score_chunk(chunk):
+    """Keyword density score; higher means more likely to be job-posting content"""
+    words = chunk.lower().split()
+    if not words:
+        return 0.0
+    total = sum(JOB_KEYWORDS.get(word, 0.0) for word in words)
+    return total / math.sqrt(len(words))
+
+
+def _scores(chunks):
+    raw = [score_chunk(chunk) for chunk in chunks]
+    # A posting's title and intro usually sit right before its keyword-heavy
+    # sections, so chunks inherit part of their neighbours' relevance
+    scores = []
+    for i, score in enumerate(raw):
+        neighbours = [raw[j] for j in (i - 1, i + 1) if 0 <= j < len(raw)]
+        scores.append(score + 0.5 * max([0.0] + neighbours))
+    return scores
+
+
+def count_postings(text):
+    lowered = text.lower()
+    return max(lowered.count(marker) for marker in POSTING_MARKERS)
+
+
+def select_relevant_text(cleaned_text, token_budget, words_per_chunk=120):
+    """Keep the highest-scoring chunks that fit in token_budget, in page order"""
+    if estimate_tokens(cleaned_text) <= token_budget:
+        return cleaned_text
+    chunks = chunk_words(cleaned_text, words_per_chunk)
+    scores = _scores(chunks)
+    keep = set()
+    used = 0
+    for i in sorted(range(len(chunks)), key=lambda i: -scores[i]):
+        cost = estimate_tokens(chunks[i]) + 1
+        if used + cost > token_budget:
+            continue
+        keep.add(i)
+        used += cost
+    if not keep:
+        # Budget smaller than a single chunk: fall back to a hard cut
+        return cleaned_text[:token_budget * 4]
+    return " ".join(chunks[i] for i in sorted(keep))
+
+
+def split_for_extraction(cleaned_text, token_budget, max_segments=4, words_per_chunk=120):
+    """
+    Prepare page text for extract_jobs within a prompt token budget.
+
+    Pages that fit are returned whole. Long pages that list a single job are cut
+    down to their most relevant chunks. Long pages that list several jobs are
+    split into up to max_segments budget-sized segments of relevant chunks, in
+    page order, to be extracted separately (map) and merged (reduce).
+    """
+    if estimate_tokens(cleaned_text) <= token_budget:
+        return [cleaned_text]
+    if count_postings(cleaned_text) < 2:
+        return [select_relevant_text(cleaned_text, token_budget, words_per_chunk)]
+
+    chunks = chunk_words(cleaned_text, words_per_chunk)
+    scores = _scores(chunks)
+    # Drop chunks with no job signal at all, then keep the best ones that fit
+    # in the overall budget across every segment
+    relevant = [i for i in range(len(chunks)) if scores[i] > 0]
+    budget = token_budget * max_segments
+    keep = set()
+    used = 0
+    for i in sorted(relevant, key=lambda i: -scores[i]):
+        cost = estimate_tokens(chunks[i]) + 1
+        if used + cost <= budget:
+            keep.add(i)
+            used += cost
+
+    segments, current, current_tokens = [], [], 0
+    for i in sorted(keep):
+        cost = estimate_tokens(chunks[i]) + 1
+        if current and current_tokens + cost > token_budget:
+            segments.append(" ".join(current))
+            current, current_tokens = [], 0
+        current.append(chunks[i])
+        current_tokens += cost
+    if current:
+        segments.append(" ".join(current))
+    return segments[:max_segments] or [select_relevant_text(cleaned_text, token_budget, words_per_chunk)]
+
+
+def merge_jobs(job_lists):
+    """Reduce step: concatenate per-segment job lists, merging repeats of the same role"""
+    merged = {}
+    for jobs in job_lists:
+        for job in jobs:
+            if not isinstance(job, dict):
+                continue
+            # Jobs without a role can't be matched up, so each stays separate
+            key = " ".join(str(job.get("role", "")).lower().split()) or f"#{len(merged)}"
+            if key not in merged:
+                merged[key] = dict(job)
+                continue
+            # A posting cut across two segments: keep the first copy, union the skills
+            existing = merged[key]
+            skills = existing.get("skills") or []
+            if isinstance(skills, list) and isinstance(job.get("skills"), list):
+                existing["skills"] = skills + [s for s in job["skills"] if s not in skills]
+            for field in ("experience", "description"):
+                if not existing.get(field) and job.get(field):
+                    existing[field] = job[field]
+    return list(merged.values())
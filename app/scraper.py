@@ -0,0 +1,187 @@
+import asyncio
+import os
+import threading
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
+
+from bs4 import BeautifulSoup
+
+from app.cache import DEFAULT_CACHE_DIR, TieredCache
+from app.http_client import get_scrape_client
+from app.metrics import stage
+from app.utils import clean_text
+
+
+# Query parameters that only track where a click came from and never change the page
+TRACKING_PARAMS = {"gclid", "fbclid", "mc_cid", "mc_eid"}
+
+
+def normalize_url(url):
+    """Canonical form of a URL used as the scrape cache key"""
+    parts = urlsplit(url.strip())
+    scheme = parts.scheme.lower()
+    host = (parts.hostname or "").lower()
+    port = parts.port
+    if port and not ((scheme == "http" and port == 80) or (scheme == "https" and port == 443)):
+        host = f"{host}:{port}"
+    query = sorted(
+        (k, v) for k, v in parse_qsl(parts.query, keep_blank_values=True)
+        if not k.lower().startswith("utm_") and k.lower() not in TRACKING_PARAMS
+    )
+    path = parts.path or "/"
+    return urlunsplit((scheme, host, path, urlencode(query), ""))
+
+
+def html_to_text(html):
+    """
+    Extract the page text as WebBaseLoader builds page_content, except that text
+    nodes are joined with a space: otherwise adjacent elements ("<li>Python</li>
+    <li>Django</li>") run together once clean_text drops the newlines.
+    """
+    return BeautifulSoup(html, "html.parser").get_text(" ")
+
+
+class ScrapeCache:
+    """
+    Cache of scraped job pages keyed by normalized URL.
+
+    Each entry keeps the clean_text output plus the ETag and Last-Modified
+    validators, so a fresh hit skips both the network and the regex pass, and an
+    expired entry can be revalidated with a conditional request. The raw HTML is
+    only kept with store_html (nothing reads it back, and pages may be megabytes).
+    """
+
+    def __init__(self, ttl=3600, max_entries=256, db_path=None, max_age=7 * 24 * 3600, store_html=False,
+                 max_db_entries=5000):
+        self.store = TieredCache("scrape_cache", max_entries=max_entries, ttl=ttl, db_path=db_path, max_age=max_age,
+                                 max_db_entries=max_db_entries)
+        self.store_html = store_html
+        self._lock = threading.Lock()
+        self.counters = {"hits": 0, "misses": 0, "revalidated": 0, "refetched": 0}
+
+    @classmethod
+    def from_env(cls):
+        return cls(
+            ttl=float(os.getenv("SCRAPE_CACHE_TTL", "3600")),
+            max_entries=int(os.getenv("SCRAPE_CACHE_SIZE", "256")),
+            db_path=os.getenv("SCRAPE_CACHE_DB", os.path.join(DEFAULT_CACHE_DIR, "scrape_cache.sqlite3")) or None,
+            store_html=os.getenv("SCRAPE_CACHE_HTML", "").lower() in ("1", "true", "yes"),
+            max_db_entries=int(os.getenv("SCRAPE_CACHE_MAX_ROWS", "5000")),
+        )
+
+    def _count(self, name):
+        with self._lock:
+            self.counters[name] += 1
+
+    def lookup(self, url):
+        """Return (entry, fresh) for url; entry is None on a miss"""
+        entry = self.store.get_entry(normalize_url(url))
+        if entry is None:
+            self._count("misses")
+            return None, False
+        fresh = self.store.is_fresh(entry)
+        if fresh:
+            self._count("hits")
+        return entry, fresh
+
+    def conditional_headers(self, entry):
+        headers = {}
+        if entry is not None:
+            if entry.value.get("etag"):
+                headers["If-None-Match"] = entry.value["etag"]
+            if entry.value.get("last_modified"):
+                headers["If-Modified-Since"] = entry.value["last_modified"]
+        return headers
+
+    def mark_revalidated(self, url):
+        self._count("revalidated")
+        self.store.touch(normalize_url(url))
+
+    def save(self, url, response, cleaned, stale=False):
+        if stale:
+            self._count("refetched")
+        if response.status_code != 200:
+            return
+        self.store.set(normalize_url(url), {
+            "url": str(response.url),
+            "html": response.text if self.store_html else "",
+            "cleaned": cleaned,
+            "etag": response.headers.get("etag"),
+            "last_modified": response.headers.get("last-modified"),
+        })
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self.counters)
+        stats["store"] = self.store.stats()
+        return stats
+
+
+_default_cache = None
+_default_cache_lock = threading.Lock()
+
+
+def get_scrape_cache():
+    """Process-wide ScrapeCache configured from SCRAPE_CACHE_* environment variables"""
+    global _default_cache
+    if _default_cache is None:
+        with _default_cache_lock:
+            if _default_cache is None:
+                _default_cache = ScrapeCache.from_env()
+    return _default_cache
+
+
+def _parse_and_clean(html, cleaner):
+    with stage("parse_html"):
+        text = html_to_text(html)
+    with stage("clean_text"):
+        return cleaner(text)
+
+
+async def fetch_page(url, headers=None, client=None):
+    """Fetch a job posting without blocking the event loop, over the shared pooled client"""
+    return await (client or get_scrape_client()).get(url, headers=headers)
+
+
+def fetch_page_sync(url, headers=None, client=None):
+    return (client or get_scrape_client()).get_sync(url, headers=headers)
+
+
+async def load_cleaned_page(url, cache=None, cleaner=clean_text):
+    """Return the cleaned text of a job posting, served from the scrape cache when possible"""
+    cache = cache or get_scrape_cache()
+    entry, fresh = cache.lookup(url)
+    if fresh:
+        return entry.value["cleaned"]
+
+    with stage("fetch"):
+        response = await fetch_page(url, headers=cache.conditional_headers(entry))
+    if entry is not None and response.status_code == 304:
+        cache.mark_revalidated(url)
+        return entry.value["cleaned"]
+    # Retries are used up by now: an error page is not worth parsing or extracting from
+    response.raise_for_status()
+
+    # BeautifulSoup parsing and the regex passes are CPU bound, so run them in a worker thread
+    cleaned = await asyncio.to_thread(_parse_and_clean, response.text, cleaner)
+    cache.save(url, response, cleaned, stale=entry is not None)
+    return cleaned
+
+
+def load_cleaned_page_sync(url, cache=None, cleaner=clean_text):
+    """Blocking variant of load_cleaned_page for the Streamlit app"""
+    cache = cache or get_scrape_cache()
+    entry, fresh = cache.lookup(url)
+    if fresh:
+        return entry.value["cleaned"]
+
+    with stage("fetch"):
+        response = fetch_page_sync(url, headers=cache.conditional_headers(entry))
+    if entry is not None and response.status_code == 304:
+        cache.mark_revalidated(url)
+        return entry.value["cleaned"]
+    # Retries are used up by now: an error page is not worth parsing or extracting from
+    response.raise_for_status()
+
+    cleaned = _parse_and_clean(response.text, cleaner)
+    cache.save(url, response, cleaned, stale=entry is not None)
+    return cleaned
@@ -0,0 +1,40 @@
+import asyncio
+
+from app.metrics import COALESCED_CALLS
+
+
+class SingleFlight:
+    """
+    Coalesces concurrent identical calls: while a call for a key is in flight,
+    further calls for that key wait for its result instead of starting their own.
+
+    The shared call runs as its own task, so a caller that gives up (timeout,
+    client disconnect) doesn't cancel it for the others. Nothing is kept once the
+    call finishes; errors reach every waiter and the next call starts afresh.
+    """
+
+    def __init__(self, name):
+        self.name = name
+        self._calls = {}
+
+    def in_flight(self):
+        return len(self._calls)
+
+    async def do(self, key, fn):
+        """Await fn() (a coroutine function), or the in-flight call for key"""
+        loop = asyncio.get_running_loop()
+        task = self._calls.get((loop, key))
+        if task is not None:
+            COALESCED_CALLS.labels(self.name).inc()
+        else:
+            task = loop.create_task(fn())
+            self._calls[(loop, key)] = task
+            task.add_done_callback(lambda done: self._finished(loop, key, done))
+        return await asyncio.shield(task)
+
+    def _finished(self, loop, key, task):
+        if self._calls.get((loop, key)) is task:
+            del self._calls[(loop, key)]
+        if not task.cancelled():
+            # Mark the error as retrieved even when every waiter has gone away
+            task.exception()
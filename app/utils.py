@@ -1,16 +1,67 @@
 import re
 
+# Precompiled patterns. `[!$-_a-z]` is exactly the character set of the original
+# URL pattern: its `[$-_@.&+]` class is a $.._ range that already covers digits,
+# upper case letters, "%", "(", ")", "*", ",", backslash and most other punctuation.
+TAG_PATTERN = re.compile(r'<[^>]*>')
+URL_PATTERN = re.compile(r'https?://[!$-_a-z]+')
+
+# Every ASCII byte except letters, digits and space
+SYMBOL_BYTES = bytes(b for b in range(128) if not (chr(b).isalnum() or b == 32))
+
+
 def clean_text(text):
-    # Remove HTML tags
-    text = re.sub(r'<[^>]*?>', '', text)
-    # Remove URLs
-    text = re.sub(r'http[s]?://(?:[a-zA-Z]|[0-9]|[$-_@.&+]|[!*\\(\\),]|(?:%[0-9a-fA-F][0-9a-fA-F]))+', '', text)
-    # Remove special characters
-    text = re.sub(r'[^a-zA-Z0-9 ]', '', text)
-    # Replace multiple spaces with a single space
-    text = re.sub(r'\s{2,}', ' ', text)
-    # Trim leading and trailing whitespace
-    text = text.strip()
-    # Remove extra whitespace
-    text = ' '.join(text.split())
-    return text
\ No newline at end of file
+    """
+    Strip HTML tags, URLs and special characters and collapse whitespace.
+
+    Output is byte for byte what the original five re.sub passes produced. Tags
+    are still removed before URLs (removing a tag can splice a URL together),
+    but the expensive per-character regex that dropped special characters is
+    replaced by an ASCII encode plus bytes.translate, which runs in C.
+    """
+    if '<' in text:
+        text = TAG_PATTERN.sub('', text)
+    text = URL_PATTERN.sub('', text)
+    # Non-ASCII characters are dropped by the encode, ASCII symbols by translate
+    data = text.encode('ascii', 'ignore').translate(None, SYMBOL_BYTES)
+    # Only spaces are left as whitespace: collapse runs and trim the ends
+    return ' '.join(data.decode('ascii').split())
+
+
+def clean_texts(texts, executor=None, chunksize=8):
+    """Clean many documents; pass a concurrent.futures executor to spread the work"""
+    if executor is None:
+        return [clean_text(text) for text in texts]
+    return list(executor.map(clean_text, texts, chunksize=chunksize))
+
+
+def iter_clean_text(chunks):
+    """
+    Clean a document that arrives in pieces (e.g. a streamed HTTP body).
+
+    Yields fragments whose concatenation equals clean_text("".join(chunks)).
+    Text is only cut at a space outside any tag, which no tag, URL or symbol
+    run can span, so memory stays bounded by the longest unbroken run rather
+    than the size of the page.
+    """
+    buffer = ''
+    emitted = False
+    for chunk in chunks:
+        buffer += chunk
+        # Never cut inside a tag: stop before the first "<" that has no ">" yet,
+        # and after the last ">" that closes one
+        last_gt = buffer.rfind('>')
+        cut = buffer.find('<', last_gt + 1)
+        if cut == -1:
+            cut = len(buffer)
+        space = buffer.rfind(' ', last_gt + 1, cut)
+        if space == -1:
+            continue
+        cleaned = clean_text(buffer[:space + 1])
+        buffer = buffer[space + 1:]
+        if cleaned:
+            yield (' ' if emitted else '') + cleaned
+            emitted = True
+    cleaned = clean_text(buffer)
+    if cleaned:
+        yield (' ' if emitted else '') + cleaned
@@ -0,0 +1,105 @@
+import asyncio
+import json
+import time
+
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+
+
+EMAIL_TEXT = (
+    "Subject: Dedicated engineering support for your open role\n\n"
+    "Dear Hiring Manager,\n\n"
+    "I noticed you are hiring and wanted to introduce our team. We have delivered "
+    "similar projects for clients in your space and can start quickly. Relevant work "
+    "from our portfolio is linked below.\n\n"
+    "Would you be open to a short call next week?\n\n"
+    "Best regards"
+)
+
+# What a model answers when the candidate fields are placeholders (Chain's mail templates)
+EMAIL_TEMPLATE = EMAIL_TEXT.replace("Dear Hiring Manager,", "__GREETING__") + "\n__YOUR_NAME__\n__YOUR_EMAIL__"
+
+JOBS = [
+    {
+        "role": "Senior Python Engineer",
+        "experience": "5+ years",
+        "skills": ["Python", "Django", "PostgreSQL", "AWS"],
+        "description": "Build and operate backend services.",
+    }
+]
+
+
+class FakeLLM(BaseChatModel):
+    """
+    Offline stand-in for ChatGroq with a configurable response time.
+
+    Extraction prompts (the ones asking for VALID JSON) get a fixed job list, the
+    fused extract-and-write prompt gets that job plus an email, an email prompt
+    with placeholder candidate fields gets a template keeping them, and every
+    other prompt gets a canned email. Each call waits `latency` seconds before the
+    first token and then emits tokens at `tokens_per_second` (0 means instantly).
+    A non-empty `model_name` is reported in response_metadata like ChatGroq does.
+    """
+
+    latency: float = 0.0
+    tokens_per_second: float = 0.0
+    model_name: str = ""
+
+    @property
+    def _llm_type(self):
+        return "fake-benchmark"
+
+    def _reply(self, messages):
+        prompt = "\n".join(str(message.content) for message in messages)
+        if "VALID JSON OBJECT" in prompt:
+            text = json.dumps(dict(JOBS[0], email=EMAIL_TEXT))
+        elif "VALID JSON" in prompt:
+            text = json.dumps(JOBS)
+        elif "__GREETING__" in prompt:
+            text = EMAIL_TEMPLATE
+        else:
+            text = EMAIL_TEXT
+        usage = {
+            "input_tokens": len(prompt) // 4 + 1,
+            "output_tokens": len(text) // 4 + 1,
+            "total_tokens": (len(prompt) + len(text)) // 4 + 2,
+        }
+        return text, usage
+
+    def _metadata(self):
+        return {"model_name": self.model_name} if self.model_name else {}
+
+    def _pieces(self, text):
+        return [text[i:i + 16] for i in range(0, len(text), 16)]
+
+    def _duration(self, text):
+        if not self.tokens_per_second:
+            return self.latency
+        return self.latency + (len(text) // 4 + 1) / self.tokens_per_second
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs):
+        text, usage = self._reply(messages)
+        time.sleep(self._duration(text))
+        message = AIMessage(content=text, usage_metadata=usage, response_metadata=self._metadata())
+        return ChatResult(generations=[ChatGeneration(message=message)])
+
+    async def _agenerate(self, messages, stop=None, run_manager=None, **kwargs):
+        text, usage = self._reply(messages)
+        await asyncio.sleep(self._duration(text))
+        message = AIMessage(content=text, usage_metadata=usage, response_metadata=self._metadata())
+        return ChatResult(generations=[ChatGeneration(message=message)])
+
+    async def _astream(self, messages, stop=None, run_manager=None, **kwargs):
+        text, usage = self._reply(messages)
+        await asyncio.sleep(self.latency)
+        pieces = self._pieces(text)
+        delay = (len(text) // 4 + 1) / self.tokens_per_second / len(pieces) if self.tokens_per_second else 0
+        for i, piece in enumerate(pieces):
+            if delay:
+                await asyncio.sleep(delay)
+            # Usage rides on the last chunk, as with the real streaming API
+            last = i == len(pieces) - 1
+            chunk = AIMessageChunk(content=piece, usage_metadata=usage if last else None,
+                                   response_metadata=self._metadata() if last else {})
+            yield ChatGenerationChunk(message=chunk)
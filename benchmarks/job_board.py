@@ -0,0 +1,88 @@
+import hashlib
+import os
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlsplit
+
+
+CORPUS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "corpus")
+
+
+def load_corpus(corpus_dir=CORPUS_DIR):
+    """Page name (file name without .html) -> HTML bytes"""
+    pages = {}
+    for name in sorted(os.listdir(corpus_dir)):
+        if name.endswith(".html"):
+            with open(os.path.join(corpus_dir, name), "rb") as f:
+                pages[name[:-len(".html")]] = f.read()
+    return pages
+
+
+class JobBoard:
+    """
+    Local careers site serving the benchmark corpus at /jobs/<page>.
+
+    Query strings are ignored, so /jobs/<page>?n=1, ?n=2 ... are distinct URLs to
+    the scrape cache but the same page. Responses carry an ETag and honour
+    If-None-Match. `latency` adds a fixed delay per request.
+    """
+
+    def __init__(self, latency=0.0, corpus_dir=CORPUS_DIR):
+        self.latency = latency
+        self.pages = load_corpus(corpus_dir)
+        self.etags = {name: '"%s"' % hashlib.md5(body).hexdigest() for name, body in self.pages.items()}
+        self.requests = 0
+        self._server = None
+
+    def _handler(self):
+        board = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                board.requests += 1
+                if board.latency:
+                    time.sleep(board.latency)
+                name = urlsplit(self.path).path.rsplit("/", 1)[-1]
+                if name not in board.pages:
+                    self.send_error(404)
+                    return
+                etag = board.etags[name]
+                if self.headers.get("If-None-Match") == etag:
+                    self.send_response(304)
+                    self.send_header("ETag", etag)
+                    self.end_headers()
+                    return
+                body = board.pages[name]
+                self.send_response(200)
+                self.send_header("Content-Type", "text/html; charset=utf-8")
+                self.send_header("Content-Length", str(len(body)))
+                self.send_header("ETag", etag)
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
+
+    def start(self):
+        self._server = ThreadingHTTPServer(("127.0.0.1", 0), self._handler())
+        self._server.daemon_threads = True
+        threading.Thread(target=self._server.serve_forever, daemon=True).start()
+        return self
+
+    def stop(self):
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+
+    def url(self, page):
+        return f"http://127.0.0.1:{self._server.server_port}/jobs/{page}"
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
@@ -0,0 +1,121 @@
+"""
+Benchmark: import time, load time and peak memory of the Portfolio loader
+against the pandas read_csv/iterrows path it replaced, on a synthetic CSV.
+
+    python -m benchmarks.portfolio_load --rows 1000000
+
+Each loader runs in a fresh interpreter so import time and peak RSS are its own.
+"""
+import argparse
+import csv
+import json
+import os
+import random
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+SKILLS = [
+    "React", "Node.js", "MongoDB", "Angular", ".NET", "SQL Server", "Vue.js", "Ruby on Rails", "PostgreSQL",
+    "Python", "Django", "MySQL", "Java", "Spring Boot", "Go", "Kubernetes", "C++", "C#", "TypeScript",
+    "Machine Learning", "TensorFlow", "AWS", "Docker", "Flutter", "Swift", "Kotlin", "GraphQL", "Redis",
+    "Rust", "Scala", "Spark", "Kafka", "Elasticsearch", "Terraform", "Azure", "GCP", "PyTorch", "Pandas",
+    "FastAPI", "Flask", "Laravel", "PHP", "Next.js", "Svelte", "React Native", "Android", "iOS", "Unity",
+]
+
+
+def write_portfolio(path, rows, seed=0):
+    rng = random.Random(seed)
+    with open(path, "w", newline="") as f:
+        writer = csv.writer(f, quoting=csv.QUOTE_ALL)
+        writer.writerow(["Techstack", "Links"])
+        for i in range(rows):
+            # Repeated techstacks collapse into one row when loaded, as before
+            techstack = ", ".join(rng.sample(SKILLS, rng.randint(3, 6)))
+            writer.writerow([techstack, f"https://example.com/portfolio/{i}"])
+
+
+def peak_rss_mb():
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return round(peak / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+
+
+def load_with_pandas(path):
+    """The previous load path: DataFrame rows into a dict, then the token index"""
+    import pandas as pd
+
+    from app.portfolio import skill_tokens
+
+    data = pd.read_csv(path)
+    store = {}
+    for _, row in data.iterrows():
+        store[row["Techstack"]] = row["Links"]
+    rows, index = [], {}
+    for techstack, link in store.items():
+        tokens = skill_tokens(str(techstack))
+        for token in set(tokens):
+            index.setdefault(token, set()).add(len(rows))
+        rows.append((tokens, link))
+    return data, store, rows, index
+
+
+def worker(loader, path):
+    start = time.perf_counter()
+    if loader == "pandas":
+        import pandas  # noqa: F401
+    import app.portfolio
+    imported = time.perf_counter()
+    rss_after_import = peak_rss_mb()
+    if loader == "pandas":
+        loaded = load_with_pandas(path)
+        rows = len(loaded[1])
+    else:
+        loaded = app.portfolio.Portfolio(path)
+        loaded.load_portfolio()
+        rows = len(loaded)
+    done = time.perf_counter()
+    print(json.dumps({
+        "rows": rows,
+        "import_ms": round((imported - start) * 1000, 1),
+        "load_ms": round((done - imported) * 1000, 1),
+        "peak_rss_mb": peak_rss_mb(),
+        "load_rss_mb": round(peak_rss_mb() - rss_after_import, 1),
+    }))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--rows", type=int, default=200000)
+    parser.add_argument("--worker", nargs=2, metavar=("LOADER", "PATH"), help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+    if args.worker:
+        worker(*args.worker)
+        return 0
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "portfolio.csv")
+        write_portfolio(path, args.rows)
+        print(f"{args.rows} CSV rows, {os.path.getsize(path) / 1e6:.1f}MB")
+        for loader in ("csv", "pandas"):
+            out = subprocess.run(
+                [sys.executable, "-m", "benchmarks.portfolio_load", "--worker", loader, path],
+                cwd=ROOT, capture_output=True, text=True
+            )
+            if out.returncode != 0:
+                print(f"  {loader:7} failed: {out.stderr.strip().splitlines()[-1]}")
+                continue
+            r = json.loads(out.stdout)
+            print(
+                f"  {loader:7} rows={r['rows']} import={r['import_ms']:.0f}ms load={r['load_ms']:.0f}ms "
+                f"peak_rss={r['peak_rss_mb']}MB (+{r['load_rss_mb']}MB loading)"
+            )
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
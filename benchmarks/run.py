@@ -0,0 +1,359 @@
+"""
+Offline end-to-end benchmark for the cold email pipeline.
+
+Runs the real FastAPI app (in process, over httpx's ASGI transport) and the
+Streamlit pipeline against a local job board and a fake LLM with configurable
+latency, so results are reproducible without network access or API keys.
+
+    python -m benchmarks.run --requests 200 --concurrency 16 --output results.json
+    python -m benchmarks.run --compare results.json    # exit 1 on a regression
+"""
+import argparse
+import asyncio
+import datetime
+import json
+import os
+import platform
+import resource
+import socket
+import subprocess
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+# Keep runs independent of each other: in-memory caches only, and no real key needed
+os.environ["SCRAPE_CACHE_DB"] = ""
+os.environ["EXTRACTION_CACHE_DB"] = ""
+os.environ["MAIL_TEMPLATE_CACHE_DB"] = ""
+os.environ["RESPONSE_CACHE_DB"] = ""
+os.environ.setdefault("GROQ_API_KEY", "offline-benchmark")
+# Every page lives on one local host; don't let the per-host rate limit set the pace
+os.environ.setdefault("SCRAPE_RATE_PER_HOST", "0")
+
+import httpx
+
+from benchmarks.fake_llm import FakeLLM
+from benchmarks.job_board import JobBoard
+
+# api_fused is the api scenario with Chain.fused on (one LLM call per email);
+# api_templates sends every page to many recipients with mail templates on;
+# cold_start times fresh server processes until / and /ready answer
+SCENARIOS = ("api", "api_fused", "api_templates", "stream", "streamlit", "cold_start")
+
+
+def percentile(values, pct):
+    if not values:
+        return None
+    ordered = sorted(values)
+    k = (len(ordered) - 1) * pct / 100
+    low = int(k)
+    high = min(low + 1, len(ordered) - 1)
+    return ordered[low] + (ordered[high] - ordered[low]) * (k - low)
+
+
+def peak_rss_mb():
+    # ru_maxrss is in kilobytes on Linux and bytes on macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return round(peak / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+
+
+def llm_tokens():
+    """Total LLM tokens recorded so far, by kind"""
+    from prometheus_client import REGISTRY
+
+    totals = {"input": 0.0, "output": 0.0}
+    for metric in REGISTRY.collect():
+        if metric.name != "cold_email_llm_tokens":
+            continue
+        for sample in metric.samples:
+            if sample.name.endswith("_total"):
+                totals[sample.labels["kind"]] += sample.value
+    return totals
+
+
+def summarize(latencies, stage_spans, wall, errors, tokens=None):
+    ms = [s * 1000 for s in latencies]
+    stages = {}
+    for name, seconds in sorted(stage_spans.items()):
+        values = [s * 1000 for s in seconds]
+        stages[name] = {
+            "count": len(values),
+            "p50_ms": round(percentile(values, 50), 3),
+            "p95_ms": round(percentile(values, 95), 3),
+        }
+    return {
+        "requests": len(latencies),
+        "errors": errors,
+        "p50_ms": round(percentile(ms, 50), 3) if ms else None,
+        "p95_ms": round(percentile(ms, 95), 3) if ms else None,
+        "p99_ms": round(percentile(ms, 99), 3) if ms else None,
+        "rps": round(len(latencies) / wall, 2) if wall else None,
+        "peak_rss_mb": peak_rss_mb(),
+        "llm_tokens_per_request": {
+            kind: round(count / len(latencies), 1) for kind, count in (tokens or {}).items()
+        } if latencies else {},
+        "stages": stages,
+    }
+
+
+class Recorder:
+    def __init__(self):
+        self.latencies = []
+        self.stages = {}
+        self.errors = 0
+
+    def add(self, seconds, spans, ok=True):
+        self.latencies.append(seconds)
+        if not ok:
+            self.errors += 1
+        for span in spans:
+            self.stages.setdefault(span["stage"], []).append(span["seconds"])
+
+
+def request_urls(board, pages, count, warm):
+    # Distinct query strings make every request a scrape (and extraction) miss;
+    # --warm reuses the same few URLs so caches are exercised instead
+    urls = []
+    for i in range(count):
+        page = pages[i % len(pages)]
+        urls.append(board.url(page) if warm else f"{board.url(page)}?n={i}")
+    return urls
+
+
+async def run_api(server, urls, concurrency, stream=False, recipients=False):
+    from app.metrics import trace
+
+    recorder = Recorder()
+    slots = asyncio.Semaphore(concurrency)
+    path = "/generate-email/stream" if stream else "/generate-email"
+
+    async def one(client, i, url):
+        recipient = f"Contact {i}" if recipients else "Sam"
+        payload = {"your_name": "Bench", "your_email": "bench@example.com", "recipient_name": recipient, "job_url": url}
+        async with slots:
+            start = time.perf_counter()
+            ok = True
+            with trace("bench_request") as spans:
+                if stream:
+                    async with client.stream("POST", path, json=payload) as response:
+                        body = b"".join([chunk async for chunk in response.aiter_bytes()])
+                    ok = response.status_code == 200 and b"event: done" in body
+                else:
+                    response = await client.post(path, json=payload)
+                    ok = response.status_code == 200
+            recorder.add(time.perf_counter() - start, spans, ok)
+
+    transport = httpx.ASGITransport(app=server.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=120) as client:
+        start = time.perf_counter()
+        await asyncio.gather(*(one(client, i, url) for i, url in enumerate(urls)))
+        wall = time.perf_counter() - start
+    return recorder, wall
+
+
+def run_streamlit(chain, portfolio, urls):
+    """The Streamlit app's sequence of blocking calls, one page at a time"""
+    from app.metrics import trace
+    from app.pipeline import extract_jobs_sync, iter_job_emails_sync, scrape_sync
+
+    workers = int(os.getenv("STREAMLIT_EMAIL_WORKERS", "4"))
+
+    recorder = Recorder()
+    portfolio.load_portfolio()
+    start = time.perf_counter()
+    for url in urls:
+        began = time.perf_counter()
+        ok = True
+        with trace("bench_request") as spans:
+            try:
+                jobs = extract_jobs_sync(chain, scrape_sync(url))
+                for _, email in iter_job_emails_sync(chain, portfolio, jobs, "Bench", "bench@example.com", "Sam",
+                                                     workers=workers):
+                    if isinstance(email, Exception):
+                        raise email
+            except Exception:
+                ok = False
+        recorder.add(time.perf_counter() - began, spans, ok)
+    return recorder, time.perf_counter() - start
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def wait_for(client, url, deadline):
+    """Poll url until it returns 200"""
+    while time.perf_counter() < deadline:
+        try:
+            if client.get(url).status_code == 200:
+                return
+        except httpx.TransportError:
+            pass
+        time.sleep(0.01)
+    raise TimeoutError(f"{url} did not answer in time")
+
+
+def run_cold_start(runs, timeout=60):
+    """
+    Start the server in a fresh process `runs` times. Latencies are the time to
+    the first 200 from / (the process can take traffic); the time until /ready
+    (LLM client and portfolio built) is recorded as the "ready" stage.
+    """
+    recorder = Recorder()
+    env = dict(os.environ, JOB_QUEUE_DB=os.path.join(ROOT, ".cache", "bench-jobs.sqlite3"))
+    # One client for all polling: building a client per request would dominate the timings
+    client = httpx.Client(timeout=1)
+    start = time.perf_counter()
+    for _ in range(runs):
+        port = free_port()
+        began = time.perf_counter()
+        process = subprocess.Popen(
+            [sys.executable, "-m", "uvicorn", "server:app", "--port", str(port), "--log-level", "warning"],
+            cwd=ROOT, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+        )
+        try:
+            deadline = began + timeout
+            wait_for(client, f"http://127.0.0.1:{port}/", deadline)
+            up = time.perf_counter() - began
+            wait_for(client, f"http://127.0.0.1:{port}/ready", deadline)
+            recorder.add(up, [{"stage": "ready", "seconds": time.perf_counter() - began}])
+        except TimeoutError:
+            recorder.add(time.perf_counter() - began, [], ok=False)
+        finally:
+            process.terminate()
+            process.wait()
+    wall = time.perf_counter() - start
+    client.close()
+    return recorder, wall
+
+
+def git_commit():
+    try:
+        out = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True, text=True)
+        return out.stdout.strip() or None
+    except OSError:
+        return None
+
+
+def compare(results, baseline, threshold):
+    """Print a per-scenario comparison; returns the list of regressions found"""
+    regressions = []
+    for name, current in results["scenarios"].items():
+        previous = baseline.get("scenarios", {}).get(name)
+        if not previous:
+            continue
+        for metric, higher_is_worse in (("p50_ms", True), ("p95_ms", True), ("rps", False)):
+            old, new = previous.get(metric), current.get(metric)
+            if not old or new is None:
+                continue
+            change = (new - old) / old
+            worse = change > threshold if higher_is_worse else change < -threshold
+            flag = "  REGRESSION" if worse else ""
+            print(f"  {name:10} {metric:7} {old:10.2f} -> {new:10.2f} ({change:+.1%}){flag}")
+            if worse:
+                regressions.append(f"{name}.{metric}")
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--requests", type=int, default=50, help="requests per scenario")
+    parser.add_argument("--cold-starts", type=int, default=5, help="server processes started by cold_start")
+    parser.add_argument("--concurrency", type=int, default=8, help="in-flight API requests")
+    parser.add_argument("--scenarios", default=",".join(SCENARIOS), help="comma separated: " + ", ".join(SCENARIOS))
+    parser.add_argument("--pages", default="", help="corpus pages to cycle through (default: all)")
+    parser.add_argument("--llm-latency", type=float, default=0.05, help="fake LLM seconds before the first token")
+    parser.add_argument("--tokens-per-second", type=float, default=0.0, help="fake LLM output speed (0: instant)")
+    parser.add_argument("--page-latency", type=float, default=0.0, help="job board seconds per response")
+    parser.add_argument("--warm", action="store_true", help="reuse URLs so scrape and extraction caches hit")
+    parser.add_argument("--output", help="write results as JSON to this path")
+    parser.add_argument("--compare", help="baseline results JSON to compare against")
+    parser.add_argument("--threshold", type=float, default=0.10, help="allowed relative slowdown (default 0.10)")
+    args = parser.parse_args(argv)
+
+    scenarios = [s.strip() for s in args.scenarios.split(",") if s.strip()]
+    unknown = set(scenarios) - set(SCENARIOS)
+    if unknown:
+        parser.error(f"unknown scenarios: {', '.join(sorted(unknown))}")
+
+    import server
+    from app.cache import TieredCache
+    from app.chains import Chain
+    from app.scraper import get_scrape_cache
+
+    llm = FakeLLM(latency=args.llm_latency, tokens_per_second=args.tokens_per_second)
+    # Pages repeat across requests, so the extraction cache (in memory) would turn
+    # cold runs into hits; it is only kept for --warm
+    server.chain = Chain(llm=llm, extraction_cache=None if args.warm else False)
+    # Load the portfolio and the rest up front rather than inside the first timed request
+    server.warm_up()
+
+    results = {
+        "meta": {
+            "timestamp": datetime.datetime.now(datetime.timezone.utc).isoformat(timespec="seconds"),
+            "git_commit": git_commit(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "config": {k: v for k, v in vars(args).items() if k not in ("output", "compare")},
+        },
+        "scenarios": {},
+    }
+
+    with JobBoard(latency=args.page_latency) as board:
+        pages = [p for p in args.pages.split(",") if p] or sorted(board.pages)
+        for name in scenarios:
+            # Fresh caches per scenario so one does not warm up the next
+            if server.chain.extraction_cache is not None:
+                server.chain.extraction_cache.clear()
+            get_scrape_cache().store.clear()
+            server.response_cache.clear()
+
+            server.chain.fused = name == "api_fused"
+            server.chain.mail_template_cache = TieredCache("mail_template") if name == "api_templates" else None
+            tokens_before = llm_tokens()
+
+            # The same postings go out to many contacts, so the URLs repeat
+            urls = request_urls(board, pages, args.requests, args.warm or name == "api_templates")
+            if name == "cold_start":
+                recorder, wall = run_cold_start(args.cold_starts)
+            elif name == "streamlit":
+                recorder, wall = run_streamlit(server.chain, server.portfolio, urls)
+            else:
+                recorder, wall = asyncio.run(run_api(
+                    server, urls, args.concurrency, stream=name == "stream", recipients=name == "api_templates"
+                ))
+            tokens = {kind: count - tokens_before[kind] for kind, count in llm_tokens().items()}
+            summary = summarize(recorder.latencies, recorder.stages, wall, recorder.errors, tokens)
+            results["scenarios"][name] = summary
+            print(
+                f"{name:10} n={summary['requests']:<5} err={summary['errors']:<3} "
+                f"p50={summary['p50_ms']:.1f}ms p95={summary['p95_ms']:.1f}ms p99={summary['p99_ms']:.1f}ms "
+                f"rps={summary['rps']:.1f} rss={summary['peak_rss_mb']}MB "
+                f"tokens/req={summary['llm_tokens_per_request'].get('input', 0):.0f}in/"
+                f"{summary['llm_tokens_per_request'].get('output', 0):.0f}out"
+            )
+            for stage_name, stats in summary["stages"].items():
+                print(f"    {stage_name:28} n={stats['count']:<5} p50={stats['p50_ms']:.2f}ms p95={stats['p95_ms']:.2f}ms")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+        print(f"results written to {args.output}")
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        print(f"compared with {args.compare} (threshold {args.threshold:.0%}):")
+        regressions = compare(results, baseline, args.threshold)
+        if regressions:
+            print("regressions: " + ", ".join(regressions))
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
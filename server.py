@@ -1,22 +1,47 @@
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, Header, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse, Response, StreamingResponse
 from pydantic import BaseModel, HttpUrl
-from langchain_community.document_loaders import WebBaseLoader
-import uvicorn
+from typing import List, Optional
+from contextlib import asynccontextmanager
+import asyncio
+import hashlib
+import json
 import os
 import sys
+import threading
 
 # Add parent directory to path for imports
 sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
-from app.chains import Chain
-from app.portfolio import Portfolio
-from app.utils import clean_text
+# Only light modules are imported here. LangChain, BeautifulSoup and httpx come
+# in with the chain, portfolio and pipeline in warm_up(), so the app can
+# answer health checks before that work is done.
+from app.metrics import register_cache, render_metrics, trace
+from app.job_queue import IdempotencyConflict, JobQueue, JobWorkers
+from app.cache import cache_from_env
+from app.compression import CompressionMiddleware
+
+
+@asynccontextmanager
+async def lifespan(app):
+    global warm_up_task
+    # Warm up in the background: / answers at once, /ready once this is done
+    if os.getenv("WARM_UP", "1").lower() not in ("0", "false", "no"):
+        warm_up_task = asyncio.create_task(asyncio.to_thread(warm_up))
+    # Background workers for POST /jobs; jobs interrupted by a restart are picked up again
+    await job_workers.start()
+    try:
+        yield
+    finally:
+        await job_workers.stop()
+
 
 app = FastAPI(
     title="Cold Email Generator API",
     description="Generate personalized cold emails for job applications",
-    version="1.0.0"
+    version="1.0.0",
+    lifespan=lifespan
 )
 
 # Add CORS middleware
@@ -26,11 +51,61 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    # Lets index.html read the ETag and send it back as If-None-Match
+    expose_headers=["ETag"],
 )
+# Complete responses are compressed (brotli when installed, else gzip); SSE and NDJSON streams are not
+app.add_middleware(CompressionMiddleware, minimum_size=int(os.getenv("COMPRESSION_MIN_SIZE", "500")))
+
+# Generated emails by ETag, so a repeated identical request (or one revalidating
+# with If-None-Match) is answered without running the pipeline again
+response_cache = cache_from_env("response_cache", "RESPONSE_CACHE", ttl=3600, max_entries=1024, max_db_entries=20000)
+RESPONSE_CACHE_CONTROL = os.getenv("RESPONSE_CACHE_CONTROL", "private, no-cache")
+
+# Chain, portfolio and pipeline limits, built by warm_up() (or assigned directly, e.g. by the benchmark)
+chain = None
+portfolio = None
+scrape_limiter = None
+_warm_up_lock = threading.Lock()
+warm_up_task = None
+
+# Shared limits for batch generation: scrapes are capped globally and per host,
+# LLM calls (extract_jobs / write_mail) run through a bounded pool of slots
+MAX_BATCH_URLS = int(os.getenv("MAX_BATCH_URLS", "1000"))
+llm_slots = asyncio.Semaphore(int(os.getenv("LLM_MAX_CONCURRENCY", "8")))
 
-# Initialize chain and portfolio
-chain = Chain()
-portfolio = Portfolio()
+
+def warm_up():
+    """Import the heavy modules and build the chain and portfolio; safe to call repeatedly"""
+    global chain, portfolio, scrape_limiter
+    with _warm_up_lock:
+        from app.pipeline import ConcurrencyLimiter
+        from app.scraper import get_scrape_cache
+
+        if scrape_limiter is None:
+            scrape_limiter = ConcurrencyLimiter(
+                max_concurrency=int(os.getenv("SCRAPE_MAX_CONCURRENCY", "20")),
+                per_host=int(os.getenv("SCRAPE_PER_HOST_CONCURRENCY", "4"))
+            )
+        if portfolio is None:
+            from app.portfolio import Portfolio
+            loaded = Portfolio()
+            loaded.load_portfolio()
+            portfolio = loaded
+        if chain is None:
+            from app.chains import Chain
+            chain = Chain()
+        register_cache("scrape", get_scrape_cache())
+        register_cache("extraction", chain.extraction_cache)
+        register_cache("mail_template", chain.mail_template_cache)
+        register_cache("response", response_cache)
+
+
+async def resources():
+    """(chain, portfolio), warming up first if that hasn't finished yet"""
+    if chain is None or portfolio is None or scrape_limiter is None:
+        await asyncio.to_thread(warm_up)
+    return chain, portfolio
 
 
 class EmailRequest(BaseModel):
@@ -40,21 +115,114 @@ class EmailRequest(BaseModel):
     job_url: str = ""
 
 
+def response_etag(chain, kind: str, request: EmailRequest) -> str:
+    """
+    ETag for a generated response: the request payload plus everything that
+    changes the output for it (model, prompt files, fused and template modes)
+    """
+    digest = hashlib.sha256()
+    parts = [kind, request.model_dump_json(), chain.model_name, str(chain.fused), str(chain.mail_template_cache is not None)]
+    parts += [prompt.current().template for _, prompt in sorted(chain.prompts.items())]
+    for part in parts:
+        digest.update(part.encode("utf-8"))
+        digest.update(b"\0")
+    return f'"{digest.hexdigest()[:32]}"'
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    # Weak comparison: a compressed response carries the same tag marked W/
+    if not if_none_match:
+        return False
+    tags = [tag.strip() for tag in if_none_match.split(",")]
+    return "*" in tags or etag in (tag[2:] if tag.startswith("W/") else tag for tag in tags)
+
+
+def caching_headers(etag: str) -> dict:
+    return {"ETag": etag, "Cache-Control": RESPONSE_CACHE_CONTROL}
+
+
+def cacheable_models(chain, models: set) -> bool:
+    """
+    True when only chain.model_name wrote the output. The ETag names that model,
+    so anything the LLM pool's fallback model answered is sent without caching.
+    """
+    return models <= {chain.model_name}
+
+
+def cached_response(etag: str, if_none_match: Optional[str]):
+    """304 or the stored body for a request answered before; None if it wasn't"""
+    body = response_cache.get(etag)
+    if body is None:
+        return None
+    if etag_matches(if_none_match, etag):
+        return Response(status_code=304, headers=caching_headers(etag))
+    return JSONResponse(body, headers=caching_headers(etag))
+
+
+class BatchEmailRequest(BaseModel):
+    your_name: str
+    your_email: str
+    recipient_name: str = ""
+    job_urls: List[str]
+
+
 @app.get("/")
 async def root():
     return {
         "message": "Cold Email Generator API is running",
         "endpoints": {
-            "POST /generate-email": "Generate a cold email for a job application"
+            "POST /generate-email": "Generate a cold email for a job application",
+            "POST /generate-email/all": "Cold emails for every job on the page, duplicate postings written once",
+            "POST /generate-email/stream": "Same as /generate-email, streamed as server-sent events",
+            "POST /generate-emails/batch": "Generate cold emails for many job URLs, streamed as NDJSON",
+            "POST /jobs": "Queue an email generation and return a job ID right away (Idempotency-Key header supported)",
+            "GET /jobs/{job_id}": "Status of a queued generation, with the email once it is done",
+            "GET /ready": "Readiness probe: 200 once the LLM client and portfolio are loaded, 503 before",
+            "GET /cache/stats": "Hit/miss counters for the scrape, extraction, mail template and response caches",
+            "GET /metrics": "Prometheus metrics: per-stage latency, errors, cache and token counters"
         }
     }
 
 
+@app.get("/ready")
+async def ready():
+    if chain is not None and portfolio is not None and scrape_limiter is not None:
+        return {"status": "ready"}
+    if warm_up_task is not None and warm_up_task.done() and warm_up_task.exception() is not None:
+        return Response(
+            content=json.dumps({"status": "error", "detail": str(warm_up_task.exception())}),
+            status_code=503,
+            media_type="application/json"
+        )
+    return Response(content=json.dumps({"status": "warming_up"}), status_code=503, media_type="application/json")
+
+
+@app.get("/metrics")
+async def metrics():
+    body, content_type = render_metrics()
+    return Response(content=body, media_type=content_type)
+
+
+@app.get("/cache/stats")
+async def cache_stats():
+    chain, _ = await resources()
+    from app.scraper import get_scrape_cache
+    return {
+        "scrape": get_scrape_cache().stats(),
+        "extraction": chain.extraction_cache.stats() if chain.extraction_cache else None,
+        "mail_template": chain.mail_template_cache.stats() if chain.mail_template_cache else None,
+        "response": response_cache.stats()
+    }
+
+
 @app.post("/generate-email")
-async def generate_email(request: EmailRequest):
+async def generate_email(request: EmailRequest, if_none_match: Optional[str] = Header(default=None)):
     """
     Generate a personalized cold email for a job application.
     
+    Responses carry an ETag; repeating the request returns the stored email, or
+    304 Not Modified when it is sent with If-None-Match.
+    
     Args:
         request: Email request with your_name, your_email, recipient_name, and job_url
         
@@ -62,56 +230,307 @@ async def generate_email(request: EmailRequest):
         Generated email as plain text
     """
     try:
-        # If no job URL provided, return a basic template
-        if not request.job_url:
-            return generate_basic_email(
-                your_name=request.your_name,
-                your_email=request.your_email,
-                recipient_name=request.recipient_name
-            )
+        with trace("generate_email", job_url=request.job_url):
+            # If no job URL provided, return a basic template
+            if not request.job_url:
+                return generate_basic_email(
+                    your_name=request.your_name,
+                    your_email=request.your_email,
+                    recipient_name=request.recipient_name
+                )
         
-        # Scrape the job posting
-        loader = WebBaseLoader([request.job_url])
-        data = loader.load().pop().page_content
+            from app.llm_pool import track_models
+            from app.pipeline import generate_email_for_url
+            chain, portfolio = await resources()
+            etag = response_etag(chain, "email", request)
+            cached = cached_response(etag, if_none_match)
+            if cached is not None:
+                return cached
+            with track_models() as models:
+                email = await generate_email_for_url(
+                    chain,
+                    portfolio,
+                    request.job_url,
+                    your_name=request.your_name,
+                    your_email=request.your_email,
+                    recipient_name=request.recipient_name
+                )
         
-        # Clean the scraped text
-        cleaned_data = clean_text(data)
+            # The fallback template is not cached: the page may well work next time
+            if email is None:
+                return generate_basic_email(
+                    your_name=request.your_name,
+                    your_email=request.your_email,
+                    recipient_name=request.recipient_name
+                )
         
-        if not cleaned_data.strip():
-            return generate_basic_email(
-                your_name=request.your_name,
-                your_email=request.your_email,
-                recipient_name=request.recipient_name
-            )
-        
-        # Extract jobs from the page
-        portfolio.load_portfolio()
-        jobs = chain.extract_jobs(cleaned_data)
+            if not cacheable_models(chain, models):
+                return email
+            response_cache.set(etag, email)
+            return JSONResponse(email, headers=caching_headers(etag))
         
-        if not jobs:
-            return generate_basic_email(
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@app.post("/generate-email/all")
+async def generate_email_all(request: EmailRequest, if_none_match: Optional[str] = Header(default=None)):
+    """
+    Generate a cold email for every job extracted from the page.
+    
+    Postings of the same role and skills (e.g. one role listed in several
+    locations) share one generation, with each posting's role and experience
+    filled in; `duplicate_of` points at the job the email was written for.
+    Cached and revalidated through ETag / If-None-Match like /generate-email.
+    
+    Returns:
+        {"job_url", "emails": [{"job", "email" or "error", "duplicate_of"}], "llm_writes"}
+    """
+    etag = None
+    models = set()
+    try:
+        with trace("generate_email_all", job_url=request.job_url):
+            results = None
+            if request.job_url:
+                from app.llm_pool import track_models
+                from app.pipeline import generate_emails_for_url
+                chain, portfolio = await resources()
+                etag = response_etag(chain, "all", request)
+                cached = cached_response(etag, if_none_match)
+                if cached is not None:
+                    return cached
+                with track_models() as models:
+                    results = await generate_emails_for_url(
+                        chain,
+                        portfolio,
+                        request.job_url,
+                        your_name=request.your_name,
+                        your_email=request.your_email,
+                        recipient_name=request.recipient_name,
+                        llm_slots=llm_slots
+                    )
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+    cacheable = (results is not None and not any("error" in entry for entry in results)
+                 and cacheable_models(chain, models))
+    if results is None:
+        email = generate_basic_email(
+            your_name=request.your_name,
+            your_email=request.your_email,
+            recipient_name=request.recipient_name
+        )
+        results = [{"job": None, "email": email, "duplicate_of": None}]
+    body = {
+        "job_url": request.job_url,
+        "emails": results,
+        "llm_writes": sum(1 for entry in results if entry["job"] is not None and entry["duplicate_of"] is None)
+    }
+    if not cacheable:
+        return body
+    response_cache.set(etag, body)
+    return JSONResponse(body, headers=caching_headers(etag))
+
+
+def sse_event(event: str, data: dict) -> str:
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+@app.post("/generate-email/stream")
+async def generate_email_stream(request: EmailRequest, if_none_match: Optional[str] = Header(default=None)):
+    """
+    Generate a personalized cold email, streamed as server-sent events.
+    
+    Emits `scraped`, `extracted` and `links` progress events, then `token` events
+    carrying email text as the LLM produces it, and finally `done` with the full
+    email (or `error` with a detail message). An email generated before for the
+    same request (shared with /generate-email) comes back as a single `token`
+    event, or as 304 Not Modified when its ETag is sent in If-None-Match.
+    """
+    etag = cached = None
+    if request.job_url:
+        try:
+            etag = response_etag((await resources())[0], "email", request)
+        except Exception:
+            # Reported as an error event by the stream below
+            pass
+    if etag is not None:
+        cached = response_cache.get(etag)
+        if cached is not None and etag_matches(if_none_match, etag):
+            return Response(status_code=304, headers=caching_headers(etag))
+
+    async def events():
+        if cached is not None:
+            yield sse_event("token", {"text": cached})
+            yield sse_event("done", {"email": cached})
+            return
+        email_parts = []
+        try:
+            with trace("generate_email_stream", job_url=request.job_url):
+                if request.job_url:
+                    from app.llm_pool import track_models
+                    from app.pipeline import stream_email_for_url
+                    chain, portfolio = await resources()
+                    with track_models() as models:
+                        async for event, data in stream_email_for_url(
+                            chain,
+                            portfolio,
+                            request.job_url,
+                            your_name=request.your_name,
+                            your_email=request.your_email,
+                            recipient_name=request.recipient_name
+                        ):
+                            if event == "token":
+                                email_parts.append(data["text"])
+                            yield sse_event(event, data)
+            
+            email = "".join(email_parts)
+            if email and etag is not None and cacheable_models(chain, models):
+                response_cache.set(etag, email)
+            if not email:
+                email = generate_basic_email(
+                    your_name=request.your_name,
+                    your_email=request.your_email,
+                    recipient_name=request.recipient_name
+                )
+            yield sse_event("done", {"email": email})
+        except Exception as e:
+            yield sse_event("error", {"detail": str(e)})
+
+    # Keep proxies from buffering the stream
+    headers = {"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    if etag is not None:
+        headers["ETag"] = etag
+    return StreamingResponse(events(), media_type="text/event-stream", headers=headers)
+
+
+@app.post("/generate-emails/batch")
+async def generate_emails_batch(request: BatchEmailRequest):
+    """
+    Generate cold emails for a list of job URLs concurrently.
+    
+    Results are streamed back as newline-delimited JSON, one object per URL in
+    completion order. A failing URL yields an error entry and does not abort the batch.
+    """
+    if not request.job_urls:
+        raise HTTPException(status_code=400, detail="job_urls must not be empty")
+    if len(request.job_urls) > MAX_BATCH_URLS:
+        raise HTTPException(status_code=400, detail=f"At most {MAX_BATCH_URLS} job URLs per batch")
+    from app.pipeline import generate_email_for_url
+    chain, portfolio = await resources()
+
+    async def run_one(index, job_url):
+        try:
+            with trace("generate_email_batch_item", job_url=job_url):
+                email = await generate_email_for_url(
+                    chain,
+                    portfolio,
+                    job_url,
+                    your_name=request.your_name,
+                    your_email=request.your_email,
+                    recipient_name=request.recipient_name,
+                    scrape_limiter=scrape_limiter,
+                    llm_slots=llm_slots
+                )
+            if email is None:
+                email = generate_basic_email(
+                    your_name=request.your_name,
+                    your_email=request.your_email,
+                    recipient_name=request.recipient_name
+                )
+            return {"index": index, "job_url": job_url, "status": "ok", "email": email}
+        except Exception as e:
+            return {"index": index, "job_url": job_url, "status": "error", "error": str(e)}
+
+    async def stream_results():
+        tasks = [asyncio.create_task(run_one(i, url)) for i, url in enumerate(request.job_urls)]
+        try:
+            for finished in asyncio.as_completed(tasks):
+                yield json.dumps(await finished) + "\n"
+        finally:
+            # Client went away or the stream was closed early
+            for task in tasks:
+                task.cancel()
+
+    return StreamingResponse(stream_results(), media_type="application/x-ndjson")
+
+
+async def run_email_job(payload: dict) -> dict:
+    """Worker side of POST /jobs: the same flow as /generate-email"""
+    request = EmailRequest(**payload)
+    email = None
+    with trace("generate_email_job", job_url=request.job_url):
+        if request.job_url:
+            from app.pipeline import generate_email_for_url
+            chain, portfolio = await resources()
+            email = await generate_email_for_url(
+                chain,
+                portfolio,
+                request.job_url,
                 your_name=request.your_name,
                 your_email=request.your_email,
-                recipient_name=request.recipient_name
+                recipient_name=request.recipient_name,
+                scrape_limiter=scrape_limiter,
+                llm_slots=llm_slots
             )
-        
-        # Generate email for the first job
-        job = jobs[0]
-        skills = job.get('skills', [])
-        links = portfolio.query_links(skills)
-        
-        email = chain.write_mail(
-            job,
-            links,
+    if email is None:
+        email = generate_basic_email(
             your_name=request.your_name,
             your_email=request.your_email,
             recipient_name=request.recipient_name
         )
-        
-        return email
-        
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
+    return {"email": email}
+
+
+# Durable submit/poll mode: jobs live in SQLite (JOB_QUEUE_DB) and survive restarts
+job_queue = JobQueue.from_env()
+job_workers = JobWorkers(job_queue, run_email_job, concurrency=int(os.getenv("JOB_WORKERS", "4")))
+
+
+def job_status(job: dict) -> dict:
+    status = {
+        "job_id": job["id"],
+        "status": job["status"],
+        "attempts": job["attempts"],
+        "created_at": job["created_at"],
+        "updated_at": job["updated_at"],
+        "status_url": f"/jobs/{job['id']}"
+    }
+    if job["status"] == "done":
+        status["email"] = job["result"]["email"]
+    elif job["error"]:
+        status["error"] = job["error"]
+        if job["status"] == "queued" and job["run_after"]:
+            # Failed, and waiting out its backoff before the next attempt
+            status["retry_at"] = job["run_after"]
+    return status
+
+
+@app.post("/jobs", status_code=202)
+async def submit_job(request: EmailRequest, response: Response, idempotency_key: Optional[str] = Header(default=None)):
+    """
+    Queue an email generation and return its job ID without waiting for it.
+    
+    Poll GET /jobs/{job_id} for the result. Repeating a request with the same
+    Idempotency-Key header returns the original job instead of queueing a new one.
+    """
+    try:
+        job, created = await asyncio.to_thread(job_queue.submit, request.model_dump(), idempotency_key)
+    except IdempotencyConflict as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    if created:
+        job_workers.notify()
+    else:
+        response.status_code = 200
+    return job_status(job)
+
+
+@app.get("/jobs/{job_id}")
+async def get_job(job_id: str):
+    job = await asyncio.to_thread(job_queue.get, job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job_status(job)
 
 
 def generate_basic_email(your_name: str, your_email: str, recipient_name: str = "") -> str:
@@ -136,5 +555,6 @@ Yours sincerely,
 
 
 if __name__ == "__main__":
+    import uvicorn
     uvicorn.run(app, host="0.0.0.0", port=8000)
 
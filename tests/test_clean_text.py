@@ -0,0 +1,62 @@
+"""
+Golden-file check that clean_text and iter_clean_text still produce exactly
+what the original five re.sub passes did.
+
+Each clean_text_corpus/<name>.txt has a <name>.expected written by
+legacy_clean_text below (job pages from benchmarks/corpus, raw and as
+html_to_text output, plus hand-written edge cases).
+"""
+import os
+import re
+import sys
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from app.utils import clean_text, iter_clean_text
+
+CORPUS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "clean_text_corpus")
+CASES = sorted(name[:-4] for name in os.listdir(CORPUS_DIR) if name.endswith(".txt"))
+
+
+def legacy_clean_text(text):
+    """clean_text as it was before the single-pass rewrite"""
+    text = re.sub(r'<[^>]*?>', '', text)
+    text = re.sub(r'http[s]?://(?:[a-zA-Z]|[0-9]|[$-_@.&+]|[!*\\(\\),]|(?:%[0-9a-fA-F][0-9a-fA-F]))+', '', text)
+    text = re.sub(r'[^a-zA-Z0-9 ]', '', text)
+    text = re.sub(r'\s{2,}', ' ', text)
+    text = text.strip()
+    return ' '.join(text.split())
+
+
+def read_case(name):
+    with open(os.path.join(CORPUS_DIR, f"{name}.txt"), encoding="utf-8", newline="") as f:
+        text = f.read()
+    with open(os.path.join(CORPUS_DIR, f"{name}.expected"), encoding="utf-8", newline="") as f:
+        expected = f.read()
+    return text, expected
+
+
+def chunked(text, size):
+    return (text[i:i + size] for i in range(0, len(text), size))
+
+
+@pytest.mark.parametrize("name", CASES)
+def test_golden_file_matches_legacy(name):
+    text, expected = read_case(name)
+    assert legacy_clean_text(text) == expected
+
+
+@pytest.mark.parametrize("name", CASES)
+def test_clean_text(name):
+    text, expected = read_case(name)
+    assert clean_text(text) == expected
+
+
+@pytest.mark.parametrize("size", [1, 7, 64, 4096])
+@pytest.mark.parametrize("name", CASES)
+def test_iter_clean_text(name, size):
+    text, expected = read_case(name)
+    assert "".join(iter_clean_text(chunked(text, size))) == expected